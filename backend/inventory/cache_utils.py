@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+DASHBOARD_STATS_TIMEOUT = 60
+LOW_STOCK_TIMEOUT = 60
+LOW_STOCK_CACHE_KEY = 'products:low_stock'
+# 30-day best sellers drift slowly; refresh on a fixed interval rather than on every sale
+BEST_SELLERS_TIMEOUT = 15 * 60
+
+
+# Backends whose entries live in (or never leave) a single process
+PROCESS_LOCAL_CACHE_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def cache_is_shared():
+    """
+    True when the default cache is shared by every worker process (e.g. Redis).
+    Invalidation only reaches the cache of the process that made the write, so
+    payloads that must reflect the latest sale are only cached on a shared backend.
+    """
+    return settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHE_BACKENDS
+
+
+def dashboard_stats_key(date=None):
+    """Cache key for the dashboard stats payload of a local calendar day"""
+    date = date or timezone.localdate()
+    return f"dashboard:stats:v2:{date.isoformat()}"
+
+
+def best_sellers_key(date=None):
+    """Cache key for the 30-day best sellers snapshot ending on a local calendar day"""
+    date = date or timezone.localdate()
+    return f"dashboard:best_sellers_30d:{date.isoformat()}"
+
+
+def _delete_cached_reads():
+    cache.delete_many([dashboard_stats_key(), LOW_STOCK_CACHE_KEY])
+
+
+def invalidate_dashboard_cache():
+    """
+    Drop cached dashboard and low-stock payloads once the current transaction commits.
+    Bulk writes (bulk_create/update) skip model signals, so views doing them call this directly.
+    """
+    transaction.on_commit(_delete_cached_reads)
@@ -4,6 +4,7 @@ import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import AnonymousUser
+from .websocket_utils import DASHBOARD_GROUP, INVENTORY_GROUP, SALES_GROUP, SHIFTS_GROUP
 
 logger = logging.getLogger(__name__)
 
@@ -17,10 +18,10 @@ class RealtimeConsumer(AsyncWebsocketConsumer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         # Initialize group names
-        self.dashboard_group = "dashboard_updates"
-        self.inventory_group = "inventory_updates"
-        self.sales_group = "sales_updates"
-        self.shifts_group = "shifts_updates"
+        self.dashboard_group = DASHBOARD_GROUP
+        self.inventory_group = INVENTORY_GROUP
+        self.sales_group = SALES_GROUP
+        self.shifts_group = SHIFTS_GROUP
     
     async def connect(self):
         self.user = self.scope["user"]
@@ -73,38 +74,29 @@ class RealtimeConsumer(AsyncWebsocketConsumer):
         except json.JSONDecodeError:
             pass
     
-    # Handler methods for different update types
+    # Handler methods for different update types. Broadcast events carry the frame
+    # already encoded (websocket_utils.group_message), so each connection just forwards it.
+    async def batch_update(self, event):
+        """Unpack broadcasts the server coalesced into one channel-layer message"""
+        for item in event['events']:
+            await self.dispatch(item)
+    
     async def dashboard_update(self, event):
         """Send dashboard updates to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'dashboard_update',
-            'data': event['data']
-        }))
+        await self.send(text_data=event['text'])
     
     async def inventory_update(self, event):
         """Send inventory updates to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'inventory_update',
-            'data': event['data']
-        }))
+        await self.send(text_data=event['text'])
     
     async def sales_update(self, event):
         """Send sales updates to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'sales_update',
-            'data': event['data']
-        }))
+        await self.send(text_data=event['text'])
     
     async def shift_update(self, event):
         """Send shift updates to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'shift_update',
-            'data': event['data']
-        }))
+        await self.send(text_data=event['text'])
     
     async def low_stock_alert(self, event):
         """Send low stock alerts to WebSocket"""
-        await self.send(text_data=json.dumps({
-            'type': 'low_stock_alert',
-            'data': event['data']
-        }))
+        await self.send(text_data=event['text'])
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-15 22:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_add_customer_audit_actions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['stock_quantity'], name='prod_active_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True), ('stock_quantity__lte', models.F('min_stock_level'))), fields=['stock_quantity'], name='prod_low_stock_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-15 22:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_product_stock_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['date_created', 'payment_method', 'total_amount'], name='sale_date_totals_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.7 on 2026-10-15 22:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_sale_date_totals_index'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.CheckConstraint(condition=models.Q(('unit_type__in', ['piece', 'kg', 'g', 'liter', 'ml', 'bundle', 'pack'])), name='product_unit_type_valid'),
+        ),
+        migrations.AddConstraint(
+            model_name='product',
+            constraint=models.CheckConstraint(condition=models.Q(('pricing_model__in', ['fixed_per_unit', 'fixed_per_weight', 'variable'])), name='product_pricing_model_valid'),
+        ),
+    ]
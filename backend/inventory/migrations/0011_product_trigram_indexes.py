@@ -0,0 +1,38 @@
+from django.db import migrations
+
+
+TRIGRAM_INDEXES = (
+    ('prod_name_trgm', 'name'),
+    ('prod_barcode_trgm', 'barcode'),
+    ('prod_category_trgm', 'category'),
+)
+
+
+def create_trigram_indexes(apps, schema_editor):
+    # pg_trgm GIN indexes let Postgres serve the search action's icontains lookups
+    # from an index; other backends (SQLite) have no equivalent, so skip them
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    for index_name, column in TRIGRAM_INDEXES:
+        schema_editor.execute(
+            f'CREATE INDEX IF NOT EXISTS {index_name} ON products USING gin ({column} gin_trgm_ops)'
+        )
+
+
+def drop_trigram_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for index_name, _ in TRIGRAM_INDEXES:
+        schema_editor.execute(f'DROP INDEX IF EXISTS {index_name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0010_product_choice_constraints'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_indexes, drop_trigram_indexes),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.7 on 2026-10-15 22:49
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0011_product_trigram_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(condition=models.Q(('is_fully_paid', False), ('payment_method', 'utang')), fields=['customer', 'date_created'], name='sale_unpaid_utang_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-15 22:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0012_sale_unpaid_utang_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['name'], name='prod_active_name_idx'),
+        ),
+    ]
@@ -1,12 +1,17 @@
 # models.py
 from django.db import models
+from django.db.models import F, Q, Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.core.validators import MinValueValidator
 from decimal import Decimal, InvalidOperation
+import logging
 import os, uuid
 from django.db.models.signals import post_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
 
+logger = logging.getLogger(__name__)
+
 # Unit Types for products
 UNIT_TYPES = [
     ('piece', 'Piece'),
@@ -115,6 +120,28 @@ class Product(models.Model):
 
     class Meta:
         db_table = 'products'
+        indexes = [
+            # Partial indexes backing the low_stock action and dashboard inventory counters
+            models.Index(fields=['stock_quantity'], condition=Q(is_active=True), name='prod_active_stock_idx'),
+            models.Index(
+                fields=['stock_quantity'],
+                condition=Q(is_active=True, stock_quantity__lte=F('min_stock_level')),
+                name='prod_low_stock_idx',
+            ),
+            # Active products by name: the catalogue's ORDER BY name and the import duplicate check
+            models.Index(fields=['name'], condition=Q(is_active=True), name='prod_active_name_idx'),
+        ]
+        constraints = [
+            # Enforce choice membership in the database so bulk/raw writes can't store invalid values
+            models.CheckConstraint(
+                condition=Q(unit_type__in=[ut[0] for ut in UNIT_TYPES]),
+                name='product_unit_type_valid',
+            ),
+            models.CheckConstraint(
+                condition=Q(pricing_model__in=[pm[0] for pm in PRICING_MODELS]),
+                name='product_pricing_model_valid',
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -205,6 +232,14 @@ class Sale(models.Model):
         db_table = 'sales'
         indexes = [
             models.Index(fields=['cashier', 'date_created']),
+            # Covers the dashboard's date-range sums split by payment method
+            models.Index(fields=['date_created', 'payment_method', 'total_amount'], name='sale_date_totals_idx'),
+            # Oldest-first unpaid utang sales per customer, walked when distributing a payment
+            models.Index(
+                fields=['customer', 'date_created'],
+                condition=Q(payment_method='utang', is_fully_paid=False),
+                name='sale_unpaid_utang_idx',
+            ),
         ]
 
     def __str__(self):
@@ -359,7 +394,34 @@ class PurchaseItem(models.Model):
             
         except Exception as e:
             # Log error but don't break the application
-            print(f"Error updating product stock for {self.product.name}: {e}")
+            logger.error("Error updating product stock for %s: %s", self.product.name, e)
+
+
+class ShiftQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        Annotate the sale/payment totals ShiftSerializer renders, one correlated subquery
+        each, so listing shifts doesn't run the properties' aggregates per row.
+        """
+        def sales_total(**filters):
+            return Coalesce(Subquery(
+                Sale.objects.filter(shift=OuterRef('pk'), **filters).order_by().values('shift')
+                .annotate(total=Sum('total_amount')).values('total')
+            ), Value(Decimal('0.00')))
+
+        return self.annotate(
+            annotated_sales_count=Coalesce(Subquery(
+                Sale.objects.filter(shift=OuterRef('pk')).order_by().values('shift')
+                .annotate(count=Count('id')).values('count')
+            ), Value(0)),
+            annotated_total_sales=sales_total(),
+            annotated_cash_sales=sales_total(payment_method='cash'),
+            annotated_credit_sales=sales_total(payment_method='utang'),
+            annotated_utang_payments_received=Coalesce(Subquery(
+                Payment.objects.filter(shift=OuterRef('pk'), method='cash').order_by().values('shift')
+                .annotate(total=Sum('amount')).values('total')
+            ), Value(Decimal('0.00'))),
+        )
 
 
 class Shift(models.Model):
@@ -381,6 +443,8 @@ class Shift(models.Model):
     
     notes = models.TextField(blank=True)
 
+    objects = ShiftQuerySet.as_manager()
+
     class Meta:
         db_table = 'shifts'
         indexes = [models.Index(fields=['user', 'start_time', 'status'])]
@@ -391,19 +455,23 @@ class Shift(models.Model):
     @property
     def sales_count(self):
         """Count of sales made during this shift"""
+        if hasattr(self, 'annotated_sales_count'):
+            return self.annotated_sales_count
         return self.sales.count()
     
     @property
     def total_sales(self):
         """Total revenue from ALL sales during this shift (cash + credit)"""
-        from django.db.models import Sum
+        if hasattr(self, 'annotated_total_sales'):
+            return self.annotated_total_sales
         total = self.sales.aggregate(total=Sum('total_amount'))['total']
         return total or Decimal('0.00')
     
     @property
     def cash_sales(self):
         """Total from cash-only sales during this shift"""
-        from django.db.models import Sum
+        if hasattr(self, 'annotated_cash_sales'):
+            return self.annotated_cash_sales
         cash_total = self.sales.filter(payment_method='cash').aggregate(
             total=Sum('total_amount')
         )['total']
@@ -412,7 +480,8 @@ class Shift(models.Model):
     @property
     def credit_sales(self):
         """Total from credit/utang sales during this shift"""
-        from django.db.models import Sum
+        if hasattr(self, 'annotated_credit_sales'):
+            return self.annotated_credit_sales
         credit_total = self.sales.filter(payment_method='utang').aggregate(
             total=Sum('total_amount')
         )['total']
@@ -421,7 +490,8 @@ class Shift(models.Model):
     @property
     def utang_payments_received(self):
         """Total cash payments received for utang during this shift"""
-        from django.db.models import Sum
+        if hasattr(self, 'annotated_utang_payments_received'):
+            return self.annotated_utang_payments_received
         payments_total = self.payments.filter(method='cash').aggregate(
             total=Sum('amount')
         )['total']
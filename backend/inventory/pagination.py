@@ -0,0 +1,13 @@
+# backend/inventory/pagination.py
+from rest_framework.pagination import PageNumberPagination
+
+
+class StandardResultsSetPagination(PageNumberPagination):
+    """
+    Page-number pagination used by every list endpoint.
+    Clients may request a larger page via ?page_size=, capped at max_page_size
+    so a single request can never serialize an entire table.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
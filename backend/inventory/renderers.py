@@ -0,0 +1,22 @@
+# renderers.py
+import orjson
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer backed by orjson for faster encoding of large payloads.
+    Types orjson doesn't handle natively (Decimal, lazy strings, querysets) and
+    datetimes are passed to DRF's encoder so output matches JSONRenderer.
+    """
+    encoder = JSONEncoder()
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # Honour ?indent/Accept indent requests with the stock renderer
+        if self.get_indent(accepted_media_type or '', renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=self.encoder.default, option=self.options)
@@ -1,5 +1,7 @@
 # serializers.py
+from decimal import Decimal
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from django.contrib.auth.models import User
 from .models import Product, Customer, Sale, SaleItem, Purchase, PurchaseItem, Payment
 from .models import Shift, UserProfile
@@ -42,6 +44,35 @@ class ProductSerializer(serializers.ModelSerializer):
         model = Product
         fields = '__all__'
 
+class ProductSearchSerializer(serializers.ModelSerializer):
+    """Lightweight serializer for POS product lookups (search/scan)"""
+    needs_restock = serializers.ReadOnlyField()
+    unit_type_display = serializers.CharField(source='get_unit_type_display', read_only=True)
+
+    class Meta:
+        model = Product
+        fields = [
+            'id', 'name', 'barcode', 'category', 'unit_type', 'unit_type_display',
+            'pricing_model', 'price', 'cost_price', 'stock_quantity', 'min_stock_level',
+            'needs_restock', 'image'
+        ]
+
+# Concrete columns read by ProductSearchSerializer, used to narrow SELECTs with .only()
+PRODUCT_SEARCH_COLUMNS = (
+    'id', 'name', 'barcode', 'category', 'unit_type', 'pricing_model',
+    'price', 'cost_price', 'stock_quantity', 'min_stock_level', 'image'
+)
+
+class ProductListSerializer(ProductSearchSerializer):
+    """Inventory/POS list rows: search fields plus the extras the product form reads"""
+    profit_margin = serializers.ReadOnlyField()
+    pricing_model_display = serializers.CharField(source='get_pricing_model_display', read_only=True)
+
+    class Meta(ProductSearchSerializer.Meta):
+        fields = ProductSearchSerializer.Meta.fields + ['pricing_model_display', 'profit_margin', 'is_active']
+
+PRODUCT_LIST_COLUMNS = PRODUCT_SEARCH_COLUMNS + ('is_active',)
+
 class CustomerSerializer(serializers.ModelSerializer):
     class Meta:
         model = Customer
@@ -75,6 +106,13 @@ class SaleSerializer(serializers.ModelSerializer):
         model = Sale
         fields = '__all__'
 
+class SaleItemInputSerializer(serializers.Serializer):
+    """Shape/type check for incoming sale lines; products are resolved in bulk by the view"""
+    product_id = serializers.IntegerField()
+    quantity = serializers.DecimalField(max_digits=None, decimal_places=None, min_value=Decimal('0.001'))
+    unit_price = serializers.DecimalField(max_digits=None, decimal_places=None, min_value=Decimal('0'))
+    requested_amount = serializers.DecimalField(max_digits=None, decimal_places=None, required=False, allow_null=True)
+
 class PurchaseItemSerializer(serializers.ModelSerializer):
     product_name = serializers.CharField(source='product.name', read_only=True)
     
@@ -89,6 +127,12 @@ class PurchaseSerializer(serializers.ModelSerializer):
         model = Purchase
         fields = '__all__'
 
+class PurchaseItemInputSerializer(serializers.Serializer):
+    """Shape/type check for incoming purchase lines; products are resolved in bulk by the view"""
+    product_id = serializers.IntegerField()
+    quantity = serializers.DecimalField(max_digits=None, decimal_places=None, min_value=Decimal('0.001'))
+    unit_cost = serializers.DecimalField(max_digits=None, decimal_places=None, min_value=Decimal('0'))
+
 class UserSerializer(serializers.ModelSerializer):
     # expose role from related UserProfile so frontend can make role-based UI decisions
     role = serializers.CharField(required=False, allow_blank=True, allow_null=True)
@@ -125,6 +169,15 @@ class UserSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'date_joined']
 
 
+class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
+    """Token pair plus the authenticated user's data, reusing the user resolved during validation"""
+
+    def validate(self, attrs):
+        data = super().validate(attrs)
+        data['user'] = UserSerializer(self.user).data
+        return data
+
+
 class UserCreateSerializer(serializers.ModelSerializer):
     """Serializer for creating users with password"""
     password = serializers.CharField(write_only=True, required=True, style={'input_type': 'password'})
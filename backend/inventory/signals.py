@@ -1,7 +1,8 @@
 from django.db.models import Sum
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Sale, Customer
+from .models import Sale, SaleItem, Product, Payment, Customer
+from .cache_utils import invalidate_dashboard_cache
 
 @receiver([post_save, post_delete], sender=Sale)
 def update_customer_total_purchases(sender, instance, **kwargs):
@@ -22,4 +23,15 @@ def update_customer_total_purchases_on_delete(sender, instance, **kwargs):
     if instance.customer:
         total = Sale.objects.filter(customer=instance.customer).aggregate(total=Sum('total_amount'))['total'] or 0
         instance.customer.total_purchases = total
-        instance.customer.save()
\ No newline at end of file
+        instance.customer.save()
+
+
+@receiver([post_save, post_delete], sender=Sale)
+@receiver([post_save, post_delete], sender=SaleItem)
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Payment)
+def invalidate_dashboard_on_change(sender, instance, **kwargs):
+    """
+    Drop cached dashboard stats and low-stock list when sales, stock or payments change.
+    """
+    invalidate_dashboard_cache()
@@ -1,7 +1,11 @@
+import tempfile
+from decimal import Decimal
+from django.core.cache import cache
+from django.test import override_settings
 from django.urls import reverse
 from rest_framework.test import APITestCase, APIClient
 from django.contrib.auth.models import User
-from .models import Product, Sale, Shift
+from .models import Customer, Payment, Product, Sale, SaleItem, Shift
 
 
 class SaleIdempotencyTest(APITestCase):
@@ -45,3 +49,190 @@ class SaleIdempotencyTest(APITestCase):
 		# Only one Sale should exist
 		sales = Sale.objects.filter(idempotency_key=key)
 		self.assertEqual(sales.count(), 1)
+
+
+class SaleStockTest(APITestCase):
+	def setUp(self):
+		self.user = User.objects.create_user(username='cashier', password='pass')
+		self.client = APIClient()
+		self.client.force_authenticate(user=self.user)
+		self.product = Product.objects.create(name='Rice', price=50, stock_quantity=10, is_active=True)
+		self.other = Product.objects.create(name='Soap', price=20, stock_quantity=5, is_active=True)
+		Shift.objects.create(user=self.user, terminal_id='test-term')
+
+	def test_sale_decrements_stock_per_product(self):
+		payload = {
+			'payment_method': 'cash',
+			'items': [
+				{'product_id': self.product.id, 'quantity': 2, 'unit_price': '50.00'},
+				{'product_id': self.other.id, 'quantity': 1, 'unit_price': '20.00'},
+				{'product_id': self.product.id, 'quantity': 3, 'unit_price': '50.00'},
+			]
+		}
+		resp = self.client.post(reverse('sale-list'), payload, format='json')
+		self.assertEqual(resp.status_code, 201)
+		self.assertEqual(resp.data['total_amount'], '270.00')
+
+		self.product.refresh_from_db()
+		self.other.refresh_from_db()
+		self.assertEqual(self.product.stock_quantity, 5)
+		self.assertEqual(self.other.stock_quantity, 4)
+		self.assertEqual(SaleItem.objects.filter(sale_id=resp.data['id']).count(), 3)
+
+	def test_sale_rejects_combined_quantity_above_stock(self):
+		payload = {
+			'payment_method': 'cash',
+			'items': [
+				{'product_id': self.other.id, 'quantity': 3, 'unit_price': '20.00'},
+				{'product_id': self.other.id, 'quantity': 3, 'unit_price': '20.00'},
+			]
+		}
+		resp = self.client.post(reverse('sale-list'), payload, format='json')
+		self.assertEqual(resp.status_code, 400)
+		self.other.refresh_from_db()
+		self.assertEqual(self.other.stock_quantity, 5)
+
+	def test_sale_rejects_malformed_item(self):
+		payload = {
+			'payment_method': 'cash',
+			'items': [{'product_id': self.product.id, 'quantity': '-1', 'unit_price': '50.00'}]
+		}
+		resp = self.client.post(reverse('sale-list'), payload, format='json')
+		self.assertEqual(resp.status_code, 400)
+		self.product.refresh_from_db()
+		self.assertEqual(self.product.stock_quantity, 10)
+
+
+class PurchaseStockTest(APITestCase):
+	def setUp(self):
+		self.user = User.objects.create_user(username='manager', password='pass')
+		self.client = APIClient()
+		self.client.force_authenticate(user=self.user)
+		self.product = Product.objects.create(name='Soap', price=20, cost_price=10, stock_quantity=2, is_active=True)
+
+	def test_purchase_adds_stock_once(self):
+		payload = {
+			'supplier': 'Supplier',
+			'items': [{'product_id': self.product.id, 'quantity': 4, 'unit_cost': '9.00'}]
+		}
+		resp = self.client.post(reverse('purchase-list'), payload, format='json')
+		self.assertEqual(resp.status_code, 201)
+
+		self.product.refresh_from_db()
+		self.assertEqual(self.product.stock_quantity, 6)
+		self.assertEqual(self.product.cost_price, Decimal('9.00'))
+
+
+class PaymentDistributionTest(APITestCase):
+	def setUp(self):
+		self.user = User.objects.create_user(username='collector', password='pass')
+		self.client = APIClient()
+		self.client.force_authenticate(user=self.user)
+		self.customer = Customer.objects.create(name='Juan', outstanding_balance=Decimal('100.00'))
+		self.older = Sale.objects.create(customer=self.customer, total_amount=50, amount_paid=0, is_fully_paid=False, payment_method='utang')
+		self.newer = Sale.objects.create(customer=self.customer, total_amount=50, amount_paid=0, is_fully_paid=False, payment_method='utang')
+
+	def test_unlinked_payment_is_split_oldest_first(self):
+		resp = self.client.post(reverse('payment-list'), {'customer': self.customer.id, 'amount': '70.00', 'method': 'cash'}, format='json')
+		self.assertEqual(resp.status_code, 201)
+
+		self.older.refresh_from_db()
+		self.newer.refresh_from_db()
+		self.customer.refresh_from_db()
+		self.assertTrue(self.older.is_fully_paid)
+		self.assertEqual(self.newer.amount_paid, Decimal('20.00'))
+		self.assertFalse(self.newer.is_fully_paid)
+		self.assertEqual(self.customer.outstanding_balance, Decimal('30.00'))
+		self.assertEqual(Payment.objects.filter(sale__isnull=False).count(), 2)
+
+	def test_overpayment_floors_balance_at_zero(self):
+		resp = self.client.post(reverse('payment-list'), {'customer': self.customer.id, 'amount': '150.00', 'method': 'cash'}, format='json')
+		self.assertEqual(resp.status_code, 201)
+
+		self.customer.refresh_from_db()
+		self.assertEqual(self.customer.outstanding_balance, Decimal('0.00'))
+
+
+@override_settings(CACHES={'default': {
+	'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+	'LOCATION': tempfile.mkdtemp(),
+}})
+class DashboardCacheTest(APITestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = User.objects.create_user(username='owner', password='pass')
+		self.client = APIClient()
+		self.client.force_authenticate(user=self.user)
+		self.product = Product.objects.create(name='Rice', price=50, stock_quantity=10, is_active=True)
+		Shift.objects.create(user=self.user, terminal_id='test-term')
+
+	def test_new_sale_invalidates_cached_stats(self):
+		url = reverse('dashboard-stats')
+		resp = self.client.get(url)
+		self.assertEqual(resp.data['sales']['today']['total'], 0.0)
+
+		payload = {
+			'payment_method': 'cash',
+			'items': [{'product_id': self.product.id, 'quantity': 2, 'unit_price': '50.00'}],
+		}
+		with self.captureOnCommitCallbacks(execute=True):
+			self.client.post(reverse('sale-list'), payload, format='json')
+
+		resp = self.client.get(url)
+		self.assertEqual(resp.data['sales']['today']['total'], 100.0)
+
+	@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+	def test_process_local_cache_is_not_used_for_stats(self):
+		url = reverse('dashboard-stats')
+		self.client.get(url)
+
+		# bulk_create skips signals, like a write another worker's cache never hears about
+		Sale.objects.bulk_create([Sale(total_amount=40, payment_method='cash')])
+		resp = self.client.get(url)
+		self.assertEqual(resp.data['sales']['today']['total'], 40.0)
+
+
+class LoginTest(APITestCase):
+	def setUp(self):
+		self.user = User.objects.create_user(username='manager1', password='pass')
+		self.user.profile.role = 'manager'
+		self.user.profile.save()
+
+	def test_login_returns_tokens_and_user(self):
+		resp = self.client.post(reverse('token_obtain_pair'), {'username': 'manager1', 'password': 'pass'}, format='json')
+		self.assertEqual(resp.status_code, 200)
+		self.assertIn('access', resp.data)
+		self.assertIn('refresh', resp.data)
+		self.assertEqual(resp.data['user']['username'], 'manager1')
+		self.assertEqual(resp.data['user']['role'], 'manager')
+
+	def test_logout_revokes_refresh_token(self):
+		tokens = self.client.post(reverse('token_obtain_pair'), {'username': 'manager1', 'password': 'pass'}, format='json').data
+		self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+		resp = self.client.post(reverse('logout'), {'refresh_token': tokens['refresh']}, format='json')
+		self.assertEqual(resp.status_code, 200)
+
+		resp = self.client.post(reverse('token_refresh'), {'refresh': tokens['refresh']}, format='json')
+		self.assertEqual(resp.status_code, 401)
+
+
+class ProductETagTest(APITestCase):
+	def setUp(self):
+		self.user = User.objects.create_user(username='viewer', password='pass')
+		self.client = APIClient()
+		self.client.force_authenticate(user=self.user)
+		self.product = Product.objects.create(name='Rice', price=50, stock_quantity=10, is_active=True)
+
+	def test_unchanged_list_is_not_modified(self):
+		url = reverse('product-list')
+		resp = self.client.get(url)
+		self.assertEqual(resp.status_code, 200)
+		etag = resp['ETag']
+
+		resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(resp.status_code, 304)
+
+		self.product.stock_quantity = 9
+		self.product.save()
+		resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(resp.status_code, 200)
@@ -1,32 +1,68 @@
 # backend/inventory/views.py
 from rest_framework import viewsets, status
-from rest_framework.decorators import action, api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes, renderer_classes
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView as BaseTokenRefreshView
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.db.models import Sum, Count, Q, F, Avg
-from django.db.models.functions import ExtractHour
+from django.db.models import Sum, Count, Q, F, Avg, Max, Case, When, Value, Prefetch
+from django.db.models.functions import ExtractHour, Greatest, TruncDate
 from django.utils import timezone
-from datetime import timedelta
-from django.db import transaction
-from decimal import Decimal, InvalidOperation
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
+from datetime import datetime, time, timedelta
+from django.db import IntegrityError, connection, transaction
+from decimal import Decimal
 from django.contrib.auth.models import User
 from .models import Product, Customer, Sale, SaleItem, Purchase, PurchaseItem, Payment, UNIT_TYPES, PRICING_MODELS
 from .models import Shift
 from .serializers import *
 from .permissions import RoleRequiredPermission
 from .decorators import drf_role_required, role_required
-from django.core.files.base import ContentFile
+from django.core.files.base import File
 from django.core.files.storage import default_storage
 from django.utils.text import slugify
+from django.conf import settings
+from django.http.request import validate_host
+from urllib.parse import unquote, urlparse
+import posixpath
+import re
+import tempfile
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import csv
+import hashlib
 import io
+import logging
 from .models import Sale, AuditLog
 from django.http.response import JsonResponse
-from .websocket_utils import broadcast_sales_update, broadcast_inventory_update, broadcast_shift_update, broadcast_dashboard_update
+from .renderers import ORJSONRenderer
+from .cache_utils import cache_is_shared, dashboard_stats_key, best_sellers_key, invalidate_dashboard_cache, DASHBOARD_STATS_TIMEOUT, BEST_SELLERS_TIMEOUT, LOW_STOCK_CACHE_KEY, LOW_STOCK_TIMEOUT
+from django.core.cache import cache
+from .websocket_utils import broadcast_after_commit, broadcast_dashboard_update_debounced, broadcast_sales_update, broadcast_inventory_update, broadcast_shift_update
+
+logger = logging.getLogger(__name__)
+
+def product_etag(request, *args, **kwargs):
+    """ETag for product reads; any product insert, edit or delete changes it.
+
+    One aggregate query lets polling clients get a 304 instead of re-serializing
+    the catalogue. Deliberately no Last-Modified: that would let browsers cache
+    stock levels heuristically instead of revalidating.
+    """
+    state = Product.objects.aggregate(count=Count('id'), last_updated=Max('updated_at'))
+    key = f"{request.get_full_path()}|{state['count']}|{state['last_updated']}"
+    return hashlib.md5(key.encode()).hexdigest()
+
 
 class ProductViewSet(viewsets.ModelViewSet):
     queryset = Product.objects.filter(is_active=True).order_by('name')
@@ -49,7 +85,20 @@ class ProductViewSet(viewsets.ModelViewSet):
             return [RoleRequiredPermission(allowed_roles)]
     
     def get_queryset(self):
-        return Product.objects.filter(is_active=True).order_by('name')
+        queryset = Product.objects.filter(is_active=True).order_by('name')
+        if self.action == 'list':
+            # Skip bookkeeping columns the list view never renders
+            queryset = queryset.only(*PRODUCT_LIST_COLUMNS)
+        return queryset
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ProductListSerializer
+        return ProductSerializer
+    
+    @method_decorator(condition(etag_func=product_etag))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
     
     def perform_destroy(self, instance):
         # Soft delete instead of actual delete
@@ -70,13 +119,10 @@ class ProductViewSet(viewsets.ModelViewSet):
             instance.save(update_fields=['image'])
         
         # Broadcast inventory update
-        try:
-            broadcast_inventory_update({
-                'action': 'created',
-                'product': ProductSerializer(instance).data
-            })
-        except Exception as e:
-            print(f"WebSocket broadcast error: {e}")
+        broadcast_after_commit(broadcast_inventory_update, {
+            'action': 'created',
+            'product': ProductSerializer(instance).data
+        })
 
         return Response(self.get_serializer(instance).data, status=status.HTTP_201_CREATED)
 
@@ -93,23 +139,28 @@ class ProductViewSet(viewsets.ModelViewSet):
             instance.save(update_fields=['image'])
         
         # Broadcast inventory update
-        try:
-            broadcast_inventory_update({
-                'action': 'updated',
-                'product': ProductSerializer(instance).data
-            })
-        except Exception as e:
-            print(f"WebSocket broadcast error: {e}")
+        broadcast_after_commit(broadcast_inventory_update, {
+            'action': 'updated',
+            'product': ProductSerializer(instance).data
+        })
 
         return Response(self.get_serializer(instance).data)
     
     @action(detail=False, methods=['get'])
+    @method_decorator(condition(etag_func=product_etag))
     def low_stock(self, request):
         try:
-            low_stock_products = Product.objects.filter(
-                stock_quantity__lte=F('min_stock_level'),
-                is_active=True
-            ).order_by('stock_quantity')
+            # Cache the rows, not serializer.data: image URLs are built from the requesting host
+            use_cache = cache_is_shared()
+            low_stock_products = cache.get(LOW_STOCK_CACHE_KEY) if use_cache else None
+            if low_stock_products is None:
+                low_stock_products = list(Product.objects.filter(
+                    stock_quantity__lte=F('min_stock_level'),
+                    is_active=True
+                ).order_by('stock_quantity'))
+                if use_cache:
+                    cache.set(LOW_STOCK_CACHE_KEY, low_stock_products, timeout=LOW_STOCK_TIMEOUT)
+            
             serializer = self.get_serializer(low_stock_products, many=True)
             return Response(serializer.data)
         except Exception as e:
@@ -122,13 +173,20 @@ class ProductViewSet(viewsets.ModelViewSet):
             if not query:
                 return Response([])
                 
-            products = Product.objects.filter(
-                Q(name__icontains=query) | 
-                Q(barcode__icontains=query) |
-                Q(category__icontains=query),
-                is_active=True
-            )[:15]  # Limit results for performance
-            serializer = self.get_serializer(products, many=True)
+            products = []
+            if query.isdigit() and len(query) >= 8:
+                # Scanner input (EAN/UPC): try a unique-index probe on barcode before any text search
+                products = list(Product.objects.filter(barcode=query, is_active=True).only(*PRODUCT_SEARCH_COLUMNS)[:1])
+            
+            if not products:
+                # On Postgres the pg_trgm GIN indexes from migration 0011 serve these icontains lookups
+                products = Product.objects.filter(
+                    Q(name__icontains=query) | 
+                    Q(barcode__icontains=query) |
+                    Q(category__icontains=query),
+                    is_active=True
+                ).only(*PRODUCT_SEARCH_COLUMNS)[:15]  # Limit results for performance
+            serializer = ProductSearchSerializer(products, many=True, context=self.get_serializer_context())
             return Response(serializer.data)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
@@ -192,6 +250,30 @@ class CustomerViewSet(viewsets.ModelViewSet):
             details=f'Customer "{customer_name}" deleted by {self.request.user.username}'
         )
 
+def own_columns_with(model, *related_columns):
+    """only() arguments keeping every column of `model` (for '__all__' serializers) plus the given joined columns"""
+    return [field.name for field in model._meta.concrete_fields] + list(related_columns)
+
+
+def sale_list_queryset():
+    """
+    Sales ordered newest first, eager-loading everything SaleSerializer touches (customer,
+    items/product, payments/customer, and the items_sold ids rendered by the '__all__'
+    field list); joined rows only need their names
+    """
+    return Sale.objects.select_related('customer').only(
+        *own_columns_with(Sale, 'customer__name')
+    ).prefetch_related(
+        Prefetch('items', queryset=SaleItem.objects.select_related('product').only(
+            *own_columns_with(SaleItem, 'product__name')
+        )),
+        Prefetch('payments', queryset=Payment.objects.select_related('customer').only(
+            *own_columns_with(Payment, 'customer__name')
+        )),
+        Prefetch('items_sold', queryset=Product.objects.only('id')),
+    ).order_by('-date_created')
+
+
 class SaleViewSet(viewsets.ModelViewSet):
     # Require authentication by default; detailed role checks are applied in get_permissions()
     permission_classes = [IsAuthenticated]
@@ -218,7 +300,7 @@ class SaleViewSet(viewsets.ModelViewSet):
         - Admin and Manager: see all sales
         - Cashier and others: see only their own sales
         """
-        queryset = Sale.objects.all().order_by('-date_created')
+        queryset = self.queryset.all()
         user = self.request.user
         
         # Check user role
@@ -234,7 +316,7 @@ class SaleViewSet(viewsets.ModelViewSet):
         # Filter by shift user (the person who made the sale)
         return queryset.filter(shift__user=user)
 
-    queryset = Sale.objects.all().order_by('-date_created')
+    queryset = sale_list_queryset()
     serializer_class = SaleSerializer
     
     @transaction.atomic
@@ -253,88 +335,104 @@ class SaleViewSet(viewsets.ModelViewSet):
                 if existing:
                     return Response(self.get_serializer(existing).data, status=status.HTTP_200_OK)
 
-            # Validate incoming payload first (do not save yet - we need to compute totals)
-            serializer = self.get_serializer(data=request.data)
-            serializer.is_valid(raise_exception=True)
-            
-            # Calculate total amount from items
-            items_data = request.data.get('items', [])
-            total_amount = 0
+            # Type-check every line once; validated_data carries native ints/Decimals
+            items_serializer = SaleItemInputSerializer(data=request.data.get('items', []), many=True)
+            items_serializer.is_valid(raise_exception=True)
+            items_data = items_serializer.validated_data
             sale_items = []
+            item_totals = []
+            
+            # Fetch stock for every requested product in one query (plain dicts, no model instances)
+            product_ids = {item_data['product_id'] for item_data in items_data}
+            stock_by_id = {
+                row['id']: row
+                for row in Product.objects.select_for_update().filter(id__in=product_ids).values('id', 'name', 'stock_quantity', 'unit_type')
+            }
+            unit_labels = dict(UNIT_TYPES)
+            requested_qty = {}
             
             # Validate stock and calculate total
             for item_data in items_data:
-                product = Product.objects.get(id=item_data['product_id'])
-                quantity = Decimal(str(item_data['quantity']))
+                row = stock_by_id.get(item_data['product_id'])
+                if row is None:
+                    raise Product.DoesNotExist
+                quantity = item_data['quantity']
                 
-                if product.stock_quantity < quantity:
+                # Compare against the total requested for this product across all cart lines
+                requested_qty[row['id']] = requested_qty.get(row['id'], Decimal('0')) + quantity
+                if row['stock_quantity'] < requested_qty[row['id']]:
                     return Response(
-                        {'error': f'Insufficient stock for {product.name}. Available: {product.stock_quantity} {product.get_unit_type_display()}'},
+                        {'error': f'Insufficient stock for {row["name"]}. Available: {row["stock_quantity"]} {unit_labels.get(row["unit_type"], row["unit_type"])}'},
                         status=status.HTTP_400_BAD_REQUEST
                     )
                 
-                unit_price = Decimal(str(item_data['unit_price']))
-                item_total = quantity * unit_price
-                total_amount += item_total
+                unit_price = item_data['unit_price']
+                item_totals.append(quantity * unit_price)
                 
                 sale_items.append({
-                    'product': product,
+                    'product_id': row['id'],
                     'quantity': quantity,
                     'unit_price': unit_price,
-                    'requested_amount': Decimal(str(item_data.get('requested_amount', 0))) if item_data.get('requested_amount') else None
+                    'requested_amount': item_data.get('requested_amount') or None
                 })
             
-            # Create sale
-            sale_data = request.data.copy()
-            sale_data['total_amount'] = total_amount
-
+            # Single C-level reduction instead of rebinding a new Decimal on every line
+            total_amount = sum(item_totals, Decimal('0'))
+            
             # Handle utang-specific fields
-            payment_method = sale_data.get('payment_method', 'cash')
+            payment_method = request.data.get('payment_method', 'cash')
             if payment_method == 'utang':
-                sale_data['amount_paid'] = Decimal('0')
-                sale_data['is_fully_paid'] = False
+                amount_paid, is_fully_paid = Decimal('0'), False
             else:
                 # For non-utang, mark fully paid
-                sale_data['amount_paid'] = Decimal(str(total_amount))
-                sale_data['is_fully_paid'] = True
-
+                amount_paid, is_fully_paid = total_amount, True
+
+            # Validate the sale payload exactly once, with the computed totals merged in
+            sale_data = {
+                **request.data,
+                'total_amount': total_amount,
+                'amount_paid': amount_paid,
+                'is_fully_paid': is_fully_paid,
+            }
             serializer = self.get_serializer(data=sale_data)
             serializer.is_valid(raise_exception=True)
 
             # Assign current active shift for the user if exists; require shift
-            active_shift = Shift.objects.filter(user=request.user, status='open').first()
+            active_shift = Shift.objects.filter(user=request.user, status='open').only('id').first()
             if not active_shift:
                 return Response({'error': 'No active shift. Please start a shift before creating sales.'}, status=status.HTTP_403_FORBIDDEN)
 
-            # Attach idempotency key if provided so duplicates are prevented
-            if idempotency_key:
-                sale_data['idempotency_key'] = idempotency_key
-                serializer = self.get_serializer(data=sale_data)
-                serializer.is_valid(raise_exception=True)
-                sale = serializer.save(cashier=request.user, shift=active_shift)
-            else:
-                sale = serializer.save(cashier=request.user, shift=active_shift)
+            # idempotency_key is read-only on the serializer, so attach it at save time
+            sale = serializer.save(cashier=request.user, shift=active_shift, idempotency_key=idempotency_key)
             
-            # Create sale items and update stock
-            for item_data in sale_items:
-                SaleItem.objects.create(
+            # Create sale items in one multi-row INSERT
+            SaleItem.objects.bulk_create([
+                SaleItem(
                     sale=sale,
-                    product=item_data['product'],
+                    product_id=item_data['product_id'],
                     quantity=item_data['quantity'],
                     unit_price=item_data['unit_price'],
                     requested_amount=item_data.get('requested_amount')
                 )
-                
-                # Update product stock
-                item_data['product'].stock_quantity -= item_data['quantity']
-                item_data['product'].save()
+                for item_data in sale_items
+            ])
+            
+            # Decrement stock for every product in a single CASE/WHEN UPDATE
+            Product.objects.filter(id__in=requested_qty).update(
+                stock_quantity=Case(*[
+                    When(id=product_id, then=F('stock_quantity') - Value(quantity))
+                    for product_id, quantity in requested_qty.items()
+                ]),
+                updated_at=timezone.now()
+            )
 
             # Update customer balances for utang
             if payment_method == 'utang' and sale.customer:
-                customer = sale.customer
-                customer.outstanding_balance = (customer.outstanding_balance or 0) + Decimal(str(total_amount))
-                customer.last_utang_date = timezone.now()
-                customer.save(update_fields=['outstanding_balance', 'last_utang_date'])
+                # Single atomic UPDATE so concurrent utang sales can't overwrite each other's balance
+                Customer.objects.filter(pk=sale.customer_id).update(
+                    outstanding_balance=F('outstanding_balance') + Value(total_amount),
+                    last_utang_date=timezone.now()
+                )
 
             # Log the sale for accountability
             AuditLog.objects.create(
@@ -345,79 +443,109 @@ class SaleViewSet(viewsets.ModelViewSet):
                 details=f'Sale #{sale.id} created - Total: ${sale.total_amount} by {request.user.username}'
             )
 
-            # Broadcast sale update via WebSocket
-            try:
-                sale_data = self.get_serializer(sale).data
-                broadcast_sales_update({
-                    'action': 'created',
-                    'sale': sale_data,
-                    'cashier': request.user.username
-                })
-                # Also update dashboard
-                broadcast_dashboard_update({'action': 'sale_created'})
-            except Exception as e:
-                print(f"WebSocket broadcast error: {e}")
+            # Broadcast sale update via WebSocket once the sale is committed
+            sale_data = self.get_serializer(sale).data
+            broadcast_after_commit(broadcast_sales_update, {
+                'action': 'created',
+                'sale': sale_data,
+                'cashier': request.user.username
+            })
+            # Also update dashboard
+            broadcast_dashboard_update_debounced({'action': 'sale_created'})
 
             headers = self.get_success_headers(serializer.data)
-            return Response(self.get_serializer(sale).data, status=status.HTTP_201_CREATED, headers=headers)
+            return Response(sale_data, status=status.HTTP_201_CREATED, headers=headers)
             
+        except ValidationError:
+            raise
         except Product.DoesNotExist:
             return Response({'error': 'Product not found'}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 class PurchaseViewSet(viewsets.ModelViewSet):
-    queryset = Purchase.objects.all().order_by('-date_created')
+    queryset = Purchase.objects.prefetch_related(
+        Prefetch('items', queryset=PurchaseItem.objects.select_related('product'))
+    ).order_by('-date_created')
     serializer_class = PurchaseSerializer
     
     @transaction.atomic
     def create(self, request):
         try:
-            serializer = self.get_serializer(data=request.data)
-            serializer.is_valid(raise_exception=True)
-            
-            items_data = request.data.get('items', [])
-            total_cost = 0
+            # Type-check every line once; validated_data carries native ints/Decimals
+            items_serializer = PurchaseItemInputSerializer(data=request.data.get('items', []), many=True)
+            items_serializer.is_valid(raise_exception=True)
+            items_data = items_serializer.validated_data
+            item_totals = []
             purchase_items = []
             
+            # Lock every referenced product in one query
+            product_ids = {item_data['product_id'] for item_data in items_data}
+            existing_ids = set(
+                Product.objects.select_for_update().filter(id__in=product_ids).values_list('id', flat=True)
+            )
+            added_qty = {}
+            latest_cost = {}
+            
             # Calculate total cost
             for item_data in items_data:
-                product = Product.objects.get(id=item_data['product_id'])
-                quantity = Decimal(str(item_data['quantity']))
-                unit_cost = Decimal(str(item_data['unit_cost']))
-                item_total = quantity * unit_cost
-                total_cost += item_total
+                product_id = item_data['product_id']
+                if product_id not in existing_ids:
+                    raise Product.DoesNotExist
+                quantity = item_data['quantity']
+                unit_cost = item_data['unit_cost']
+                item_totals.append(quantity * unit_cost)
+                added_qty[product_id] = added_qty.get(product_id, Decimal('0')) + quantity
+                latest_cost[product_id] = unit_cost
                 
                 purchase_items.append({
-                    'product': product,
+                    'product_id': product_id,
                     'quantity': quantity,
                     'unit_cost': unit_cost
                 })
             
-            # Create purchase
-            purchase_data = request.data.copy()
-            purchase_data['total_cost'] = total_cost
+            total_cost = sum(item_totals, Decimal('0'))
+            
+            # Create purchase (validated once, with the computed total merged in)
+            purchase_data = {**request.data, 'total_cost': total_cost}
             serializer = self.get_serializer(data=purchase_data)
             serializer.is_valid(raise_exception=True)
             purchase = serializer.save()
             
-            # Create purchase items and update stock
-            for item_data in purchase_items:
-                PurchaseItem.objects.create(
+            # Create purchase items in one INSERT. bulk_create bypasses PurchaseItem.save(),
+            # so stock is applied once below and the items are flagged as already added.
+            PurchaseItem.objects.bulk_create([
+                PurchaseItem(
                     purchase=purchase,
-                    product=item_data['product'],
+                    product_id=item_data['product_id'],
                     quantity=item_data['quantity'],
-                    unit_cost=item_data['unit_cost']
+                    unit_cost=item_data['unit_cost'],
+                    added_to_stock=True
                 )
-                
-                # Update product stock and cost price
-                product = item_data['product']
-                product.stock_quantity = Decimal(str(product.stock_quantity)) + item_data['quantity']
-                product.cost_price = item_data['unit_cost']  # Update to latest cost
-                product.save()
+                for item_data in purchase_items
+            ])
+            
+            # Update product stock and cost price (latest cost wins) in a single UPDATE
+            Product.objects.filter(id__in=added_qty).update(
+                stock_quantity=Case(*[
+                    When(id=product_id, then=F('stock_quantity') + Value(quantity))
+                    for product_id, quantity in added_qty.items()
+                ]),
+                cost_price=Case(*[
+                    When(id=product_id, then=Value(unit_cost))
+                    for product_id, unit_cost in latest_cost.items()
+                ]),
+                updated_at=timezone.now()
+            )
+            # The UPDATE above skips Product signals, so drop cached low-stock/dashboard reads here
+            invalidate_dashboard_cache()
             
             return Response(serializer.data, status=status.HTTP_201_CREATED)
             
+        except ValidationError:
+            raise
+        except Product.DoesNotExist:
+            return Response({'error': 'Product not found'}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -461,7 +589,7 @@ class ShiftViewSet(viewsets.ModelViewSet):
         return Response(self.get_serializer(shift).data)
 
 class PaymentViewSet(viewsets.ModelViewSet):
-    queryset = Payment.objects.all().order_by('-date_created')
+    queryset = Payment.objects.select_related('customer', 'sale').order_by('-date_created')
     serializer_class = PaymentSerializer
 
     @transaction.atomic
@@ -473,17 +601,16 @@ class PaymentViewSet(viewsets.ModelViewSet):
         # Get current active shift if user is authenticated
         active_shift = None
         if request.user.is_authenticated:
-            active_shift = Shift.objects.filter(user=request.user, end_time__isnull=True).first()
+            active_shift = Shift.objects.filter(user=request.user, end_time__isnull=True).only('id').first()
         
         # Save payment with shift reference
         payment = serializer.save(shift=active_shift)
 
-        # Apply payment to customer balance
+        # Apply payment to customer balance in one atomic UPDATE, floored at zero
         customer = payment.customer
-        customer.outstanding_balance = (customer.outstanding_balance or 0) - payment.amount
-        if customer.outstanding_balance < 0:
-            customer.outstanding_balance = 0
-        customer.save(update_fields=['outstanding_balance'])
+        Customer.objects.filter(pk=payment.customer_id).update(
+            outstanding_balance=Greatest(F('outstanding_balance') - Value(payment.amount), Value(Decimal('0')))
+        )
 
         # If payment is linked to a specific sale, update that sale
         if payment.sale:
@@ -495,15 +622,17 @@ class PaymentViewSet(viewsets.ModelViewSet):
         else:
             # If payment is not linked to a specific sale, distribute it across unpaid sales
             # Get all unpaid Utang sales for this customer, ordered by date (oldest first)
-            unpaid_sales = Sale.objects.filter(
+            unpaid_sales = list(Sale.objects.select_for_update().filter(
                 customer=customer,
                 payment_method='utang',
                 is_fully_paid=False
-            ).order_by('date_created')
+            ).order_by('date_created'))
             
             remaining_payment = payment.amount
+            modified_sales = []
+            split_payments = []
             
-            # Distribute payment across unpaid sales and create payment records for tracking
+            # Distribute payment across unpaid sales in memory; writes are batched after the loop
             for sale in unpaid_sales:
                 if remaining_payment <= 0:
                     break
@@ -518,20 +647,26 @@ class PaymentViewSet(viewsets.ModelViewSet):
                     if sale.amount_paid >= sale.total_amount:
                         sale.is_fully_paid = True
                     
-                    sale.save(update_fields=['amount_paid', 'is_fully_paid'])
+                    modified_sales.append(sale)
                     
-                    # Create a payment record linked to this sale for tracking split payments
+                    # Payment record linked to this sale for tracking split payments
                     # This allows tracking of each portion when a payment is split across multiple sales
-                    Payment.objects.create(
+                    split_payments.append(Payment(
                         customer=customer,
                         sale=sale,
                         amount=payment_to_apply,
                         method=payment.method,
                         notes=f"From payment #{payment.id}" + (f": {payment.notes}" if payment.notes else "")
-                    )
+                    ))
                     
                     remaining_payment -= payment_to_apply
             
+            if modified_sales:
+                Sale.objects.bulk_update(modified_sales, ['amount_paid', 'is_fully_paid'], batch_size=500)
+                Payment.objects.bulk_create(split_payments, batch_size=500)
+                # Bulk writes skip post_save, so run the signal's cache invalidation explicitly
+                invalidate_dashboard_cache()
+            
             # Note: The original payment record remains unlinked (sale=null) when distributed
             # This serves as an audit record of the total payment made
             # Individual sale payment histories show the split portions created above
@@ -549,7 +684,20 @@ class PaymentViewSet(viewsets.ModelViewSet):
       except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def local_day_start(date):
+    """Timezone-aware midnight of `date` in the configured TIME_ZONE"""
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
 class DashboardViewSet(viewsets.ViewSet):
+    def conditional_stats_response(self, request, etag, payload):
+        """304 when the client already holds this payload's ETag, else the payload"""
+        etag = quote_etag(etag)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+        return Response(payload, headers={'ETag': etag})
+
     def stats(self, request):
         try:
             # Use timezone-aware local datetime (respect settings.TIME_ZONE)
@@ -558,72 +706,82 @@ class DashboardViewSet(viewsets.ViewSet):
             # configured TIME_ZONE (e.g. Asia/Manila)
             now = timezone.localtime()
             today = now.date()
+            cache_key = dashboard_stats_key(today)
+            use_cache = cache_is_shared()
+            cached = cache.get(cache_key) if use_cache else None
+            if cached is not None:
+                return self.conditional_stats_response(request, *cached)
+            
             week_ago = today - timedelta(days=7)
             month_ago = today - timedelta(days=30)
             
+            # Half-open [start, end) timestamp bounds so filters can use the
+            # date_created index instead of casting every row to a date
+            today_start = local_day_start(today)
+            tomorrow_start = local_day_start(today + timedelta(days=1))
+            week_start = local_day_start(week_ago)
+            month_start = local_day_start(month_ago)
+            
             # Debug logging
-            print(f"Dashboard Stats - Current time: {now}")
-            print(f"Dashboard Stats - Today's date: {today}")
+            logger.debug("Dashboard Stats - Current time: %s, today's date: %s", now, today)
             
             # Sales data - separated by payment method
-            # Today's sales - ensure we're comparing dates correctly
-            today_cash_sales = Sale.objects.filter(
-                date_created__date=today,
-                payment_method='cash'
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
+            # All today/week/month windows come from one conditional aggregate over the month range
+            is_cash = Q(payment_method='cash')
+            is_credit = Q(payment_method='utang')
+            in_today = Q(date_created__gte=today_start, date_created__lt=tomorrow_start)
+            in_week = Q(date_created__gte=week_start)
+            sales_totals = Sale.objects.filter(date_created__gte=month_start).aggregate(
+                today_cash=Sum('total_amount', filter=in_today & is_cash),
+                today_credit=Sum('total_amount', filter=in_today & is_credit),
+                today_count=Count('id', filter=in_today),
+                week_cash=Sum('total_amount', filter=in_week & is_cash),
+                week_credit=Sum('total_amount', filter=in_week & is_credit),
+                month_cash=Sum('total_amount', filter=is_cash),
+                month_credit=Sum('total_amount', filter=is_credit),
+                month_total=Sum('total_amount'),
+            )
             
-            today_credit_sales = Sale.objects.filter(
-                date_created__date=today,
-                payment_method='utang'
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
+            today_cash_sales = sales_totals['today_cash'] or 0
+            today_credit_sales = sales_totals['today_credit'] or 0
             
             # Debug: Check what sales exist
-            today_sales_count = Sale.objects.filter(date_created__date=today).count()
-            print(f"Dashboard Stats - Today's sale count: {today_sales_count}")
-            print(f"Dashboard Stats - Today cash: {today_cash_sales}, credit: {today_credit_sales}")
+            today_sales_count = sales_totals['today_count']
+            logger.debug(
+                "Dashboard Stats - Today's sale count: %s, cash: %s, credit: %s",
+                today_sales_count, today_cash_sales, today_credit_sales
+            )
             
             today_sales = today_cash_sales + today_credit_sales
             
             # Weekly sales
-            weekly_cash_sales = Sale.objects.filter(
-                date_created__date__gte=week_ago,
-                payment_method='cash'
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
-            
-            weekly_credit_sales = Sale.objects.filter(
-                date_created__date__gte=week_ago,
-                payment_method='utang'
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
-            
+            weekly_cash_sales = sales_totals['week_cash'] or 0
+            weekly_credit_sales = sales_totals['week_credit'] or 0
             weekly_sales = weekly_cash_sales + weekly_credit_sales
             
             # Monthly sales
-            monthly_cash_sales = Sale.objects.filter(
-                date_created__date__gte=month_ago,
-                payment_method='cash'
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
-            
-            monthly_credit_sales = Sale.objects.filter(
-                date_created__date__gte=month_ago,
-                payment_method='utang'
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
-            
+            monthly_cash_sales = sales_totals['month_cash'] or 0
+            monthly_credit_sales = sales_totals['month_credit'] or 0
             monthly_sales = monthly_cash_sales + monthly_credit_sales
             
-            # Sales trends - last 30 days daily breakdown with cash/credit separation
+            # Sales trends - last 30 days daily breakdown with cash/credit separation,
+            # grouped by local day in one query and zero-filled in Python
+            trend_days = [today - timedelta(days=i) for i in range(29, -1, -1)]
+            daily_totals = {
+                row['day']: row
+                for row in Sale.objects.filter(
+                    date_created__gte=local_day_start(trend_days[0]),
+                    date_created__lt=tomorrow_start
+                ).annotate(day=TruncDate('date_created')).values('day').annotate(
+                    cash=Sum('total_amount', filter=is_cash),
+                    credit=Sum('total_amount', filter=is_credit)
+                ).order_by()
+            }
             sales_trend = []
-            for i in range(29, -1, -1):
-                date = today - timedelta(days=i)
-                daily_cash = Sale.objects.filter(
-                    date_created__date=date,
-                    payment_method='cash'
-                ).aggregate(total=Sum('total_amount'))['total'] or 0
-                
-                daily_credit = Sale.objects.filter(
-                    date_created__date=date,
-                    payment_method='utang'
-                ).aggregate(total=Sum('total_amount'))['total'] or 0
-                
+            for date in trend_days:
+                totals = daily_totals.get(date, {})
+                daily_cash = totals.get('cash') or 0
+                daily_credit = totals.get('credit') or 0
                 sales_trend.append({
                     'date': date.isoformat(),
                     'cash': float(daily_cash),
@@ -633,60 +791,64 @@ class DashboardViewSet(viewsets.ViewSet):
             
             # Payment method breakdown (last 30 days)
             payment_breakdown = Sale.objects.filter(
-                date_created__date__gte=month_ago
+                date_created__gte=month_start
             ).values('payment_method').annotate(
                 total=Sum('total_amount'),
                 count=Count('id')
             ).order_by('-total')
             
             # Profit analysis (last 30 days) - handle NULL cost_price gracefully
-            revenue = Sale.objects.filter(
-                date_created__date__gte=month_ago
-            ).aggregate(total=Sum('total_amount'))['total'] or 0
+            # Month revenue across all payment methods rides on the sales aggregate above
+            revenue = sales_totals['month_total'] or 0
             
             # Calculate cost from sale items (only for products with cost_price set)
             try:
                 cost_data = SaleItem.objects.filter(
-                    sale__date_created__date__gte=month_ago,
+                    sale__date_created__gte=month_start,
                     product__cost_price__isnull=False
                 ).aggregate(
                     total_cost=Sum(F('quantity') * F('product__cost_price'))
                 )
                 total_cost = cost_data['total_cost'] or 0
             except Exception as cost_err:
-                print(f"Cost calculation error: {cost_err}")
+                logger.warning("Cost calculation error: %s", cost_err)
                 total_cost = 0
             
             gross_profit = float(revenue) - float(total_cost)
             profit_margin = (gross_profit / float(revenue) * 100) if revenue > 0 else 0
             
-            # Product counts
-            low_stock_count = Product.objects.filter(
-                stock_quantity__lte=F('min_stock_level'),
-                is_active=True
-            ).count()
-            
-            total_products = Product.objects.filter(is_active=True).count()
-            out_of_stock_count = Product.objects.filter(stock_quantity=0, is_active=True).count()
+            # Product counts (single pass over active products)
+            product_counts = Product.objects.filter(is_active=True).aggregate(
+                total=Count('id'),
+                low_stock=Count('id', filter=Q(stock_quantity__lte=F('min_stock_level'))),
+                out_of_stock=Count('id', filter=Q(stock_quantity=0)),
+            )
+            total_products = product_counts['total']
+            low_stock_count = product_counts['low_stock']
+            out_of_stock_count = product_counts['out_of_stock']
             
             # Recent sales for dashboard
-            recent_sales = Sale.objects.select_related('customer', 'cashier', 'shift').prefetch_related('items').order_by('-date_created')[:5]
+            recent_sales = sale_list_queryset()[:5]
             recent_sales_data = SaleSerializer(recent_sales, many=True).data
             
-            # Best selling products (last 30 days)
-            best_sellers = SaleItem.objects.filter(
-                sale__date_created__gte=month_ago
-            ).values(
-                'product__name', 'product__id'
-            ).annotate(
-                total_sold=Sum('quantity'),
-                total_revenue=Sum(F('quantity') * F('unit_price'))
-            ).order_by('-total_sold')[:5]
+            # Best selling products (last 30 days), served from a snapshot refreshed every BEST_SELLERS_TIMEOUT
+            best_sellers = cache.get_or_set(
+                best_sellers_key(today),
+                lambda: list(SaleItem.objects.filter(
+                    sale__date_created__gte=month_start
+                ).values(
+                    'product__name', 'product__id'
+                ).annotate(
+                    total_sold=Sum('quantity'),
+                    total_revenue=Sum(F('quantity') * F('unit_price'))
+                ).order_by('-total_sold')[:5]),
+                timeout=BEST_SELLERS_TIMEOUT
+            )
             
             # Top customers by spending (last 30 days)
             try:
                 top_customers = Sale.objects.filter(
-                    date_created__date__gte=month_ago,
+                    date_created__gte=month_start,
                     customer__isnull=False
                 ).values(
                     'customer__id', 'customer__name'
@@ -700,7 +862,7 @@ class DashboardViewSet(viewsets.ViewSet):
             # Category performance (last 30 days)
             try:
                 category_performance = SaleItem.objects.filter(
-                    sale__date_created__date__gte=month_ago,
+                    sale__date_created__gte=month_start,
                     product__category__isnull=False
                 ).values(
                     'product__category'
@@ -714,7 +876,7 @@ class DashboardViewSet(viewsets.ViewSet):
             # Shift performance (last 30 days)
             try:
                 shift_performance = Sale.objects.filter(
-                    date_created__date__gte=month_ago,
+                    date_created__gte=month_start,
                     cashier__isnull=False
                 ).values(
                     'cashier__username', 'cashier__id'
@@ -738,10 +900,10 @@ class DashboardViewSet(viewsets.ViewSet):
                     count=Count('id')
                 ).order_by('hour')
             except Exception as hourly_err:
-                print(f"Hourly sales error: {hourly_err}")
+                logger.warning("Hourly sales error: %s", hourly_err)
                 hourly_sales = []
             
-            return Response({
+            payload = {
                 'sales': {
                     'today': {
                         'total': float(today_sales),
@@ -778,15 +940,144 @@ class DashboardViewSet(viewsets.ViewSet):
                 'category_performance': list(category_performance),
                 'shift_performance': list(shift_performance),
                 'hourly_pattern': list(hourly_sales),
-            })
+            }
+            # Hash the rendered payload so an unchanged recompute keeps the same ETag
+            etag = hashlib.md5(ORJSONRenderer().render(payload)).hexdigest()
+            if use_cache:
+                cache.set(cache_key, (etag, payload), timeout=DASHBOARD_STATS_TIMEOUT)
+            return self.conditional_stats_response(request, etag, payload)
             
         except Exception as e:
-            import traceback
-            print(f"Dashboard stats error: {str(e)}")
-            print(traceback.format_exc())
+            logger.exception("Dashboard stats error: %s", e)
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+MAX_IMAGE_SIZE = 5 * 1024 * 1024  # 5MB
+IMAGE_CHUNK_SIZE = 64 * 1024
+IMAGE_WRITE_SIZE = 512 * 1024  # storage write size; fewer, larger writes per image
+IMAGE_SPOOL_SIZE = 2 * 1024 * 1024  # larger downloads overflow to a temp file while being hashed
+IMAGE_FETCH_TIMEOUT = (5, 15)  # (connect, read) seconds
+IMAGE_DOWNLOAD_WORKERS = 8  # concurrent fetches during bulk import; stays under the session pool size
+
+
+def build_image_session():
+    """Shared HTTP session for image fetches: keep-alive connection pool plus retries on gateway errors"""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=32,
+        max_retries=Retry(total=2, backoff_factor=0.3, status_forcelist=[502, 503, 504]),
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+image_session = build_image_session()
+
+
+IMAGE_EXT_BY_MIME = {
+    'image/jpeg': '.jpg',
+    'image/jpg': '.jpg',
+    'image/pjpeg': '.jpg',
+    'image/png': '.png',
+    'image/webp': '.webp',
+    'image/gif': '.gif',
+}
+
+
+def image_extension(content_type):
+    """File extension for an image Content-Type header (parameters ignored), or None if unknown"""
+    return IMAGE_EXT_BY_MIME.get(content_type.partition(';')[0].strip().lower())
+
+
+def local_media_path(url, request_host=None):
+    """Storage path for a URL that already points at our own MEDIA_URL, or None.
+
+    Lets image imports reuse files we already serve instead of downloading them
+    from ourselves. Only hosts from ALLOWED_HOSTS (never the '*' wildcard) or the
+    current request's host count as local, and the file must exist in storage.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ('', 'http', 'https'):
+        return None
+    if parsed.netloc:
+        local_hosts = [host for host in settings.ALLOWED_HOSTS if host != '*']
+        if request_host:
+            local_hosts.append(request_host.rsplit(':', 1)[0])
+        if not parsed.hostname or not validate_host(parsed.hostname, local_hosts):
+            return None
+    if not parsed.path.startswith(settings.MEDIA_URL):
+        return None
+
+    storage_path = posixpath.normpath(unquote(parsed.path[len(settings.MEDIA_URL):]))
+    if storage_path in ('', '.') or storage_path.startswith(('..', '/')):
+        return None
+    try:
+        return storage_path if default_storage.exists(storage_path) else None
+    except Exception:
+        # e.g. SuspiciousFileOperation for paths outside MEDIA_ROOT
+        return None
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class CappedResponseStream(io.RawIOBase):
+    """Read-only view of a streamed response body that aborts past MAX_IMAGE_SIZE"""
+
+    def __init__(self, resp):
+        resp.raw.decode_content = True
+        self._raw = resp.raw
+        self._read = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self._raw.readinto(buffer)
+        self._read += count
+        if self._read > MAX_IMAGE_SIZE:
+            raise ImageTooLarge()
+        return count
+
+
+class StreamedImageFile(File):
+    """File wrapper whose chunks() hands storage ~512KB blocks instead of Django's 64KB default"""
+    DEFAULT_CHUNK_SIZE = IMAGE_WRITE_SIZE
+
+
+def save_streamed_image(resp, slug, ext):
+    """Write a streamed (stream=True) image response to storage, named by its content.
+
+    The body is spooled (in memory up to IMAGE_SPOOL_SIZE, then on disk) while
+    being hashed, and stored as products/<slug>-<sha256 prefix><ext>. Re-importing
+    the same picture for a product reuses the stored file after one exists() check,
+    and distinct content never collides, so there's no get_available_name() probing.
+    Raises ImageTooLarge once MAX_IMAGE_SIZE is exceeded, before anything is stored.
+    """
+    content_length = resp.headers.get('Content-Length')
+    if content_length and content_length.isdigit() and int(content_length) > MAX_IMAGE_SIZE:
+        raise ImageTooLarge()
+
+    body = CappedResponseStream(resp)
+    digest = hashlib.sha256()
+    with tempfile.SpooledTemporaryFile(max_size=IMAGE_SPOOL_SIZE) as spool:
+        buffer = bytearray(IMAGE_CHUNK_SIZE)
+        view = memoryview(buffer)
+        while count := body.readinto(buffer):
+            digest.update(view[:count])
+            spool.write(view[:count])
+
+        # Keep well inside ImageField's default max_length of 100
+        storage_path = f"products/{slug[:60]}-{digest.hexdigest()[:16]}{ext}"
+        if default_storage.exists(storage_path):
+            return storage_path
+        spool.seek(0)
+        return default_storage.save(storage_path, StreamedImageFile(spool))
+
+
 @api_view(['POST'])
 def download_image(request):
     """Download an external image and save it to MEDIA_ROOT/products/.
@@ -800,36 +1091,29 @@ def download_image(request):
     if not url:
         return Response({'error': 'url is required'}, status=status.HTTP_400_BAD_REQUEST)
 
+    existing_path = local_media_path(url, request.get_host())
+    if existing_path:
+        return Response({
+            'image_path': existing_path,
+            'image_url': request.build_absolute_uri(default_storage.url(existing_path)),
+        }, status=status.HTTP_200_OK)
+
     try:
-        resp = requests.get(url, timeout=15)
-        if resp.status_code != 200:
-            return Response({'error': f'Failed to fetch image: {resp.status_code}'}, status=status.HTTP_400_BAD_REQUEST)
-
-        content_type = resp.headers.get('Content-Type', '')
-        if not content_type.startswith('image'):
-            return Response({'error': 'Provided URL is not an image'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Determine extension
-        ext = None
-        if 'jpeg' in content_type or 'jpg' in content_type:
-            ext = '.jpg'
-        elif 'png' in content_type:
-            ext = '.png'
-        elif 'webp' in content_type:
-            ext = '.webp'
-        elif 'gif' in content_type:
-            ext = '.gif'
-        else:
-            # Fallback: try to extract from URL
-            _, url_ext = os.path.splitext(url)
-            ext = url_ext if url_ext else '.jpg'
+        with image_session.get(url, timeout=IMAGE_FETCH_TIMEOUT, stream=True) as resp:
+            if resp.status_code != 200:
+                return Response({'error': f'Failed to fetch image: {resp.status_code}'}, status=status.HTTP_400_BAD_REQUEST)
 
-        filename = f"{slugify(name) or 'image'}{ext}"
-        relative_path = f"products/{filename}"
+            content_type = resp.headers.get('Content-Type', '')
+            if not content_type.startswith('image'):
+                return Response({'error': 'Provided URL is not an image'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Ensure we don't overwrite existing file
-        storage_path = default_storage.get_available_name(relative_path)
-        saved_path = default_storage.save(storage_path, ContentFile(resp.content))
+            # Determine extension; fallback: try to extract from URL
+            ext = image_extension(content_type)
+            if ext is None:
+                _, url_ext = os.path.splitext(url)
+                ext = url_ext if url_ext else '.jpg'
+
+            saved_path = save_streamed_image(resp, slugify(str(name)) or 'image', ext)
         public_url = default_storage.url(saved_path)
         # Ensure frontend gets an absolute URL (includes host) so it can load the image
         try:
@@ -839,12 +1123,77 @@ def download_image(request):
 
         return Response({'image_path': saved_path, 'image_url': absolute_url}, status=status.HTTP_201_CREATED)
 
+    except ImageTooLarge:
+        return Response({'error': f'Image exceeds maximum size of {MAX_IMAGE_SIZE // (1024 * 1024)}MB'}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+# Choice keys for CSV validation, built once instead of per row
+UNIT_TYPE_KEYS = frozenset(ut[0] for ut in UNIT_TYPES)
+UNIT_TYPE_CHOICES_TEXT = ", ".join(ut[0] for ut in UNIT_TYPES)
+PRICING_MODEL_KEYS = frozenset(pm[0] for pm in PRICING_MODELS)
+PRICING_MODEL_CHOICES_TEXT = ", ".join(pm[0] for pm in PRICING_MODELS)
+
+
+# Plain decimal numbers only: screens out bad cells without Decimal raising, and
+# rejects forms Decimal would accept but a price never is (NaN, Infinity, 1e3)
+CSV_DECIMAL_RE = re.compile(r'-?(?:\d+(?:\.\d*)?|\.\d+)')
+
+
+def parse_csv_decimal(raw, label, required=False, default=None):
+    """
+    Parse a non-negative decimal CSV cell in one pass.
+    Returns (value, error); blank cells yield `default`, or an error when required.
+    """
+    raw = raw.strip()
+    if not raw:
+        return (None, f'{label} is required') if required else (default, None)
+    if not CSV_DECIMAL_RE.fullmatch(raw):
+        return None, f'Invalid {label.lower()} value: {raw}'
+    value = Decimal(raw)
+    if value < 0:
+        return None, f'{label} must be >= 0'
+    return value, None
+
+
+def parse_csv_text(raw, label=None, required=False, default=None):
+    """Parse a free-text CSV cell; returns (value, error) like parse_csv_decimal"""
+    raw = raw.strip()
+    if not raw:
+        return (None, f'{label} is required') if required else (default, None)
+    return raw, None
+
+
+def parse_csv_choice(raw, field, keys, choices_text, default):
+    """Parse a case-insensitive choice CSV cell; returns (value, error)"""
+    value = raw.strip().lower() or default
+    if value not in keys:
+        return None, f'Invalid {field}: {value}. Must be one of: {choices_text}'
+    return value, None
+
+
+# Column -> parser for each CSV product field, in the order row errors are reported.
+# Each parser takes the raw cell and returns (value, error).
+CSV_FIELD_SPECS = [
+    ('name', partial(parse_csv_text, label='Name', required=True)),
+    ('price', partial(parse_csv_decimal, label='Price', required=True)),
+    ('stock_quantity', partial(parse_csv_decimal, label='Stock quantity', required=True)),
+    ('barcode', parse_csv_text),
+    ('category', partial(parse_csv_text, default='')),
+    ('unit_type', partial(parse_csv_choice, field='unit_type', keys=UNIT_TYPE_KEYS,
+                          choices_text=UNIT_TYPE_CHOICES_TEXT, default='piece')),
+    ('pricing_model', partial(parse_csv_choice, field='pricing_model', keys=PRICING_MODEL_KEYS,
+                              choices_text=PRICING_MODEL_CHOICES_TEXT, default='fixed_per_unit')),
+    ('cost_price', partial(parse_csv_decimal, label='Cost price')),
+    ('min_stock_level', partial(parse_csv_decimal, label='Min stock level', default=Decimal('5'))),
+    ('image_url', parse_csv_text),
+]
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
+@renderer_classes([ORJSONRenderer])
 def bulk_import_products(request):
     """
     Bulk import products from CSV file.
@@ -859,6 +1208,7 @@ def bulk_import_products(request):
     
     MAX_FILE_SIZE = 5 * 1024 * 1024  # 5MB
     MAX_ROWS = 1000
+    MAX_PREVIEW_ROWS = 100  # preview table only renders the head of the file
     
     if 'file' not in request.FILES:
         return Response({'error': 'CSV file is required'}, status=status.HTTP_400_BAD_REQUEST)
@@ -878,20 +1228,10 @@ def bulk_import_products(request):
         return Response({'error': 'File must be a CSV file'}, status=status.HTTP_400_BAD_REQUEST)
     
     try:
-        # Read and parse CSV
-        decoded_file = csv_file.read().decode('utf-8-sig')
-        csv_reader = csv.DictReader(io.StringIO(decoded_file))
-        rows = list(csv_reader)
-        
-        # Validate basic file structure
-        if len(rows) > MAX_ROWS:
-            return Response(
-                {'error': f'CSV file contains {len(rows)} rows. Maximum allowed is {MAX_ROWS} rows.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        if len(rows) == 0:
-            return Response({'error': 'CSV file is empty'}, status=status.HTTP_400_BAD_REQUEST)
+        # Parse the upload lazily: rows are decoded and validated one at a time
+        # instead of holding the decoded text and a list of row dicts in memory
+        text_stream = io.TextIOWrapper(csv_file.file, encoding='utf-8-sig', newline='')
+        csv_reader = csv.DictReader(text_stream)
         
         # Validate headers
         required_headers = ['name', 'price', 'stock_quantity']
@@ -904,132 +1244,74 @@ def bulk_import_products(request):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Process rows
-        validated_rows = []
-        errors = []
-        
-        # Use iterator for better performance with large datasets
-        existing_names = Product.objects.filter(is_active=True).values_list('name', flat=True)
-        existing_barcodes = Product.objects.filter(
-            is_active=True, 
-            barcode__isnull=False
-        ).exclude(barcode='').values_list('barcode', flat=True)
-        
-        existing_names_set = set(existing_names)
-        existing_barcodes_set = set(existing_barcodes)
+        # Process rows; duplicates against the database are checked after the pass
+        checked_rows = []
         
+        csv_names = set()
         seen_names_in_csv = set()
         seen_barcodes_in_csv = set()
         
-        for row_num, row in enumerate(rows, start=2):
+        row_count = 0
+        for row_num, row in enumerate(csv_reader, start=2):
+            row_count += 1
+            if row_count > MAX_ROWS:
+                return Response(
+                    {'error': f'CSV file contains more than {MAX_ROWS} rows. Maximum allowed is {MAX_ROWS} rows.'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
             row_errors = []
             row_data = {}
             
-            # Process name
-            name = row.get('name', '').strip()
-            if not name:
-                row_errors.append('Name is required')
-            else:
-                row_data['name'] = name
-                # Check duplicates in CSV
+            for field, parse in CSV_FIELD_SPECS:
+                # Short rows leave trailing cells as None
+                value, error = parse(row.get(field) or '')
+                if error:
+                    row_errors.append(error)
+                else:
+                    row_data[field] = value
+            
+            # Check duplicates in CSV
+            name = row_data.get('name')
+            if name:
+                csv_names.add(name)
                 if name.lower() in seen_names_in_csv:
                     row_errors.append(f'Duplicate product name in CSV: "{name}"')
                 else:
                     seen_names_in_csv.add(name.lower())
-                # Check duplicates in database
-                if name in existing_names_set:
-                    row_errors.append(f'Product with name "{name}" already exists')
-            
-            # Process price
-            price_str = row.get('price', '').strip()
-            if not price_str:
-                row_errors.append('Price is required')
-            else:
-                try:
-                    price = Decimal(price_str)
-                    if price < 0:
-                        row_errors.append('Price must be >= 0')
-                    else:
-                        row_data['price'] = price
-                except (InvalidOperation, ValueError):
-                    row_errors.append(f'Invalid price value: {price_str}')
             
-            # Process stock
-            stock_str = row.get('stock_quantity', '').strip()
-            if not stock_str:
-                row_errors.append('Stock quantity is required')
-            else:
-                try:
-                    stock = Decimal(stock_str)
-                    if stock < 0:
-                        row_errors.append('Stock quantity must be >= 0')
-                    else:
-                        row_data['stock_quantity'] = stock
-                except (InvalidOperation, ValueError):
-                    row_errors.append(f'Invalid stock quantity value: {stock_str}')
-            
-            # Process barcode
-            barcode = row.get('barcode', '').strip() or None
+            barcode = row_data.get('barcode')
             if barcode:
-                # Check duplicates in CSV
                 if barcode in seen_barcodes_in_csv:
                     row_errors.append(f'Duplicate barcode in CSV: "{barcode}"')
                 else:
                     seen_barcodes_in_csv.add(barcode)
-                # Check duplicates in database
-                if barcode in existing_barcodes_set:
-                    row_errors.append(f'Product with barcode "{barcode}" already exists')
-                row_data['barcode'] = barcode
-            
-            # Process other fields...
-            category = row.get('category', '').strip() or ''
-            row_data['category'] = category
-            
-            unit_type = row.get('unit_type', '').strip().lower() or 'piece'
-            valid_unit_types = [ut[0] for ut in UNIT_TYPES]
-            if unit_type not in valid_unit_types:
-                row_errors.append(f'Invalid unit_type: {unit_type}. Must be one of: {", ".join(valid_unit_types)}')
-            else:
-                row_data['unit_type'] = unit_type
-            
-            pricing_model = row.get('pricing_model', '').strip().lower() or 'fixed_per_unit'
-            valid_pricing_models = [pm[0] for pm in PRICING_MODELS]
-            if pricing_model not in valid_pricing_models:
-                row_errors.append(f'Invalid pricing_model: {pricing_model}. Must be one of: {", ".join(valid_pricing_models)}')
-            else:
-                row_data['pricing_model'] = pricing_model
-            
-            # Process cost price
-            cost_price_str = row.get('cost_price', '').strip()
-            if cost_price_str:
-                try:
-                    cost_price = Decimal(cost_price_str)
-                    if cost_price < 0:
-                        row_errors.append('Cost price must be >= 0')
-                    else:
-                        row_data['cost_price'] = cost_price
-                except (InvalidOperation, ValueError):
-                    row_errors.append(f'Invalid cost price value: {cost_price_str}')
-            else:
-                row_data['cost_price'] = None
             
-            # Process min stock level
-            min_stock_str = row.get('min_stock_level', '').strip()
-            if min_stock_str:
-                try:
-                    min_stock = Decimal(min_stock_str)
-                    if min_stock < 0:
-                        row_errors.append('Min stock level must be >= 0')
-                    else:
-                        row_data['min_stock_level'] = min_stock
-                except (InvalidOperation, ValueError):
-                    row_errors.append(f'Invalid min stock level value: {min_stock_str}')
-            else:
-                row_data['min_stock_level'] = Decimal('5')
-            
-            # Process image URL
-            image_url = row.get('image_url', '').strip() or None
-            row_data['image_url'] = image_url
+            checked_rows.append((row_num, row_errors, row_data))
+        
+        if row_count == 0:
+            return Response({'error': 'CSV file is empty'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Ask the database only about the names/barcodes this file uses, instead of loading
+        # every product's; both lookups are index scans bounded by MAX_ROWS values
+        existing_names_set = set(
+            Product.objects.filter(is_active=True, name__in=csv_names).values_list('name', flat=True)
+        )
+        # barcode is unique across all products, so inactive ones count as taken too
+        existing_barcodes_set = set(
+            Product.objects.filter(barcode__in=seen_barcodes_in_csv).values_list('barcode', flat=True)
+        )
+        
+        validated_rows = []
+        errors = []
+        for row_num, row_errors, row_data in checked_rows:
+            # Check duplicates in database
+            db_errors = []
+            if row_data.get('name') in existing_names_set:
+                db_errors.append(f'Product with name "{row_data["name"]}" already exists')
+            if row_data.get('barcode') in existing_barcodes_set:
+                db_errors.append(f'Product with barcode "{row_data["barcode"]}" already exists')
+            row_errors = db_errors + row_errors
             
             if row_errors:
                 errors.append({
@@ -1056,7 +1338,7 @@ def bulk_import_products(request):
             return Response({
                 'valid': False,
                 'errors': errors,
-                'total_rows': len(rows),
+                'total_rows': row_count,
                 'valid_rows': len(validated_rows),
                 'error_rows': len(errors)
             }, status=status.HTTP_400_BAD_REQUEST)
@@ -1065,89 +1347,88 @@ def bulk_import_products(request):
         if preview_only:
             return Response({
                 'valid': True,
-                'preview': validated_rows,
+                'preview': validated_rows[:MAX_PREVIEW_ROWS],
                 'total_rows': len(validated_rows),
                 'download_images': download_images
             }, status=status.HTTP_200_OK)
         
         # Perform actual import
-        imported_products = []
         skipped_products = []
         
+        # Duplicates against the database and within the CSV were already rejected
+        # during validation
+        new_products = []
+        imported_rows = []
+        image_urls = []
+        for row_info in validated_rows:
+            row_data = row_info['data']
+            new_products.append(Product(
+                name=row_data['name'],
+                barcode=row_data.get('barcode'),
+                category=row_data.get('category', ''),
+                unit_type=row_data.get('unit_type', 'piece'),
+                pricing_model=row_data.get('pricing_model', 'fixed_per_unit'),
+                price=row_data['price'],
+                cost_price=row_data.get('cost_price'),
+                stock_quantity=row_data['stock_quantity'],
+                min_stock_level=row_data.get('min_stock_level', Decimal('5')),
+                is_active=True
+            ))
+            imported_rows.append(row_info['row'])
+            image_urls.append(row_data.get('image_url') if download_images else None)
+        
+        # Insert products, queue image fetches and write the audit entry in one transaction:
+        # a single commit for the whole import, and nothing persists if any step fails
         with transaction.atomic():
-            for row_info in validated_rows:
-                row_data = row_info['data']
-                name = row_data['name']
-                barcode = row_data.get('barcode')
-                
-                # Final duplicate check within transaction
-                if Product.objects.filter(is_active=True, name=name).exists():
-                    skipped_products.append({
-                        'row': row_info['row'],
-                        'name': name,
-                        'reason': 'Product with this name already exists'
-                    })
-                    continue
-                
-                if barcode and Product.objects.filter(is_active=True, barcode=barcode).exists():
-                    skipped_products.append({
-                        'row': row_info['row'],
-                        'name': name,
-                        'reason': 'Product with this barcode already exists'
-                    })
-                    continue
-                
-                # Create product
-                product_data = {
-                    'name': name,
-                    'barcode': barcode,
-                    'category': row_data.get('category', ''),
-                    'unit_type': row_data.get('unit_type', 'piece'),
-                    'pricing_model': row_data.get('pricing_model', 'fixed_per_unit'),
-                    'price': row_data['price'],
-                    'cost_price': row_data.get('cost_price'),
-                    'stock_quantity': row_data['stock_quantity'],
-                    'min_stock_level': row_data.get('min_stock_level', Decimal('5')),
-                    'is_active': True
-                }
-                
-                # Handle image download
-                image_path = None
-                if download_images and row_data.get('image_url'):
-                    image_path = download_and_save_image(row_data['image_url'], name)
-                
-                # Create and save product
-                product = Product(**product_data)
-                if image_path:
-                    product.image.name = image_path
-                product.save()
-                
-                imported_products.append({
-                    'row': row_info['row'],
+            # bulk_create skips post_save, so invalidate caches here
+            Product.objects.bulk_create(new_products, batch_size=500)
+            invalidate_dashboard_cache()
+            
+            # Image fetches are network-bound; run them on a background thread once the
+            # products are committed instead of blocking the request worker
+            pending_images = [
+                (product.id, product.name, image_url)
+                for product, image_url in zip(new_products, image_urls)
+                if image_url
+            ]
+            if pending_images:
+                transaction.on_commit(lambda: threading.Thread(
+                    target=download_product_images, args=(pending_images,), daemon=True
+                ).start())
+            
+            imported_products = [
+                {
+                    'row': row,
                     'id': product.id,
                     'name': product.name,
                     'barcode': product.barcode
-                })
-        
-        # Log successful import
-        AuditLog.objects.create(
-            user=request.user,
-            action='INVENTORY_UPDATE',
-            model='Product',
-            details=f'Bulk import successful: {len(imported_products)} products imported, {len(skipped_products)} skipped'
-        )
+                }
+                for row, product in zip(imported_rows, new_products)
+            ]
+            
+            # Log successful import
+            AuditLog.objects.create(
+                user=request.user,
+                action='INVENTORY_UPDATE',
+                model='Product',
+                details=f'Bulk import successful: {len(imported_products)} products imported, {len(skipped_products)} skipped'
+            )
         
         return Response({
             'success': True,
             'imported': len(imported_products),
             'skipped': len(skipped_products),
-            'total_rows': len(rows),
+            'images_pending': len(pending_images),
+            'total_rows': row_count,
             'imported_products': imported_products,
             'skipped_products': skipped_products
         }, status=status.HTTP_201_CREATED)
         
     except UnicodeDecodeError:
         return Response({'error': 'Invalid file encoding. Please use UTF-8 encoded CSV file.'}, status=status.HTTP_400_BAD_REQUEST)
+    except IntegrityError as e:
+        # Unique barcode / choice CHECK constraints are the final guard for rows that slipped past validation
+        return Response({'error': f'Import rejected by database constraints: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
     except Exception as e:
         # Log the error
         AuditLog.objects.create(
@@ -1158,47 +1439,61 @@ def bulk_import_products(request):
         )
         return Response({'error': f'Error processing CSV file: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-def download_and_save_image(image_url, product_name):
-    """Helper function to download and save product image"""
+def download_and_save_image(image_url, product_name, slug=None):
+    """Helper function to download and save product image; `slug` skips re-slugifying the name"""
+    existing_path = local_media_path(image_url)
+    if existing_path:
+        return existing_path
     try:
-        resp = requests.get(image_url, timeout=15)
-        if resp.status_code == 200 and resp.headers.get('Content-Type', '').startswith('image'):
-            # Determine file extension
-            content_type = resp.headers.get('Content-Type', '')
-            ext = '.jpg'  # default
-            if 'png' in content_type:
-                ext = '.png'
-            elif 'webp' in content_type:
-                ext = '.webp'
-            elif 'gif' in content_type:
-                ext = '.gif'
-            
-            filename = f"{slugify(product_name) or 'product'}{ext}"
-            relative_path = f"products/{filename}"
-            storage_path = default_storage.get_available_name(relative_path)
-            saved_path = default_storage.save(storage_path, ContentFile(resp.content))
-            return saved_path
+        with image_session.get(image_url, timeout=IMAGE_FETCH_TIMEOUT, stream=True) as resp:
+            if resp.status_code == 200 and resp.headers.get('Content-Type', '').startswith('image'):
+                # Determine file extension
+                ext = image_extension(resp.headers.get('Content-Type', '')) or '.jpg'
+                
+                return save_streamed_image(resp, slug or slugify(product_name) or 'product', ext)
+    except ImageTooLarge:
+        logger.warning("Image for %s exceeds %sMB, skipped", product_name, MAX_IMAGE_SIZE // (1024 * 1024))
     except Exception as e:
-        print(f"Failed to download image for {product_name}: {str(e)}")
+        logger.warning("Failed to download image for %s: %s", product_name, e)
     return None
 
+def download_product_images(pending_images):
+    """
+    Background worker for bulk import: download each (product_id, name, url) image
+    concurrently and attach the saved paths with one batched UPDATE.
+    """
+    try:
+        # Slugify each distinct name once; imports often repeat product names
+        slug_map = {name: slugify(name) or 'product' for name in {name for _, name, _ in pending_images}}
+
+        # download_and_save_image swallows its own errors, so one bad URL can't sink the batch
+        with ThreadPoolExecutor(max_workers=IMAGE_DOWNLOAD_WORKERS) as pool:
+            image_paths = list(pool.map(
+                lambda pending: download_and_save_image(pending[2], pending[1], slug_map[pending[1]]),
+                pending_images
+            ))
+        
+        with_images = []
+        now = timezone.now()
+        for (product_id, _, _), image_path in zip(pending_images, image_paths):
+            if image_path:
+                product = Product(id=product_id, updated_at=now)
+                product.image.name = image_path
+                with_images.append(product)
+        if with_images:
+            # bulk_update skips auto_now, so bump updated_at explicitly for product ETags
+            Product.objects.bulk_update(with_images, ['image', 'updated_at'], batch_size=500)
+    except Exception as e:
+        logger.exception("Failed to attach imported product images: %s", e)
+    finally:
+        # Threads get their own DB connection; don't leak it
+        connection.close()
+
 # Authentication Views
 class CustomTokenObtainPairView(TokenObtainPairView):
     """Custom login view that returns user data along with tokens"""
     permission_classes = [AllowAny]
-    
-    def post(self, request, *args, **kwargs):
-        response = super().post(request, *args, **kwargs)
-        if response.status_code == 200:
-            # Get user data
-            username = request.data.get('username')
-            try:
-                user = User.objects.get(username=username)
-                user_serializer = UserSerializer(user)
-                response.data['user'] = user_serializer.data
-            except User.DoesNotExist:
-                pass
-        return response
+    serializer_class = CustomTokenObtainPairSerializer
 
 
 class CustomTokenRefreshView(BaseTokenRefreshView):
@@ -1208,6 +1503,7 @@ class CustomTokenRefreshView(BaseTokenRefreshView):
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@renderer_classes([ORJSONRenderer])
 def get_current_user(request):
     """Get current authenticated user information"""
     serializer = UserSerializer(request.user)
@@ -1217,15 +1513,19 @@ def get_current_user(request):
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout(request):
-    """Logout endpoint (JWT is stateless, but we can blacklist token if needed)"""
-    try:
-        refresh_token = request.data.get('refresh_token')
-        if refresh_token:
-            token = RefreshToken(refresh_token)
-            token.blacklist()
-        return Response({'message': 'Successfully logged out'}, status=status.HTTP_200_OK)
-    except Exception as e:
-        return Response({'message': 'Successfully logged out'}, status=status.HTTP_200_OK)
+    """Logout endpoint: blacklist the refresh token so it can't mint new access tokens"""
+    refresh_token = request.data.get('refresh_token')
+    if refresh_token:
+        try:
+            # One INSERT; done before responding so a reported logout has really revoked the token
+            RefreshToken(refresh_token).blacklist()
+        except TokenError:
+            # Invalid or expired tokens can't be used to refresh anyway
+            pass
+        except Exception as e:
+            logger.exception("Failed to blacklist refresh token for %s: %s", request.user.username, e)
+            return Response({'error': 'Logout failed, please try again'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    return Response({'message': 'Successfully logged out'}, status=status.HTTP_200_OK)
     
 @api_view(['GET'])
 @drf_role_required(['admin', 'manager'])
@@ -1243,14 +1543,21 @@ def sales_performance_report(request):
         'cashier__profile__role'
     ).annotate(
         total_sales=Count('id'),
-        total_revenue=Sum('total_amount'),
-        average_sale=Avg('total_amount')
+        total_revenue=Sum('total_amount')
     ).order_by('-total_revenue')
 
+    # Derive the average from the two aggregates instead of a third accumulator per group
+    data = list(sales_data)
+    for row in data:
+        row['average_sale'] = (
+            (row['total_revenue'] / row['total_sales']).quantize(Decimal('0.01'))
+            if row['total_sales'] else Decimal('0.00')
+        )
+
     return Response({
         'period_days': days,
         'start_date': start_date,
-        'data': list(sales_data)
+        'data': data
     })
 
 
@@ -1259,7 +1566,7 @@ class UserViewSet(viewsets.ModelViewSet):
     """
     ViewSet for user management (admin only)
     """
-    queryset = User.objects.all().order_by('-date_joined')
+    queryset = User.objects.select_related('profile').order_by('-date_joined')
     serializer_class = UserSerializer
     permission_classes = [IsAuthenticated, RoleRequiredPermission]
     allowed_roles = ['admin', 'manager']
@@ -1278,7 +1585,8 @@ class ShiftViewSet(viewsets.ModelViewSet):
     """
     ViewSet for shift management and reporting
     """
-    queryset = Shift.objects.all().order_by('-start_time')
+    # ShiftSerializer renders user names and per-shift totals; load both with the rows
+    queryset = Shift.objects.select_related('user').with_totals().order_by('-start_time')
     serializer_class = ShiftSerializer
     permission_classes = [IsAuthenticated, RoleRequiredPermission]
     allowed_roles = ['admin', 'manager']
@@ -1290,7 +1598,7 @@ class ShiftViewSet(viewsets.ModelViewSet):
         return super().get_permissions()
     
     def get_queryset(self):
-        queryset = Shift.objects.all().order_by('-start_time')
+        queryset = self.queryset.all()
         
         # Filter by date range if provided
         start_date = self.request.query_params.get('start_date')
@@ -1306,14 +1614,14 @@ class ShiftViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'], url_path='active')
     def active(self, request):
         """Get all currently active shifts"""
-        active_shifts = Shift.objects.filter(end_time__isnull=True).order_by('-start_time')
+        active_shifts = self.queryset.filter(end_time__isnull=True)
         serializer = self.get_serializer(active_shifts, many=True)
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'], url_path='my-shift')
     def my_shift(self, request):
         """Get current user's active shift"""
-        shift = Shift.objects.filter(user=request.user, end_time__isnull=True).first()
+        shift = self.queryset.filter(user=request.user, end_time__isnull=True).first()
         if shift:
             serializer = self.get_serializer(shift)
             return Response(serializer.data)
@@ -1341,27 +1649,14 @@ class ShiftViewSet(viewsets.ModelViewSet):
             status='open'
         )
         
-        # Broadcast shift update
-        try:
-            shift_data = ShiftSerializer(shift).data
-            print(f"DEBUG: shift_data type: {type(shift_data)}")
-            print(f"DEBUG: shift_data keys: {shift_data.keys() if hasattr(shift_data, 'keys') else 'N/A'}")
-            
-            # Check for Decimal values
-            for key, value in shift_data.items():
-                print(f"DEBUG: {key} = {value} (type: {type(value)})")
-            
-            # Convert to dict to ensure proper serialization
-            broadcast_shift_update({
-                'action': 'started',
-                'shift': dict(shift_data)
-            })
-        except Exception as e:
-            print(f"WebSocket broadcast error: {e}")
-            import traceback
-            traceback.print_exc()
+        # Serialize once for both the broadcast (sent after commit) and the response
+        shift_data = ShiftSerializer(shift).data
+        broadcast_after_commit(broadcast_shift_update, {
+            'action': 'started',
+            'shift': dict(shift_data)
+        })
         
-        return Response(ShiftSerializer(shift).data, status=status.HTTP_201_CREATED)
+        return Response(shift_data, status=status.HTTP_201_CREATED)
     
     @action(detail=True, methods=['post'], url_path='end')
     def end_shift(self, request, pk=None):
@@ -1390,25 +1685,19 @@ class ShiftViewSet(viewsets.ModelViewSet):
         shift.status = 'closed'
         shift.save()
         
-        # Broadcast shift update
-        try:
-            shift_data = ShiftSerializer(shift).data
-            # Convert to dict to ensure proper serialization
-            broadcast_shift_update({
-                'action': 'ended',
-                'shift': dict(shift_data)
-            })
-        except Exception as e:
-            print(f"WebSocket broadcast error: {e}")
-            import traceback
-            traceback.print_exc()
+        # Serialize once for both the broadcast (sent after commit) and the response
+        shift_data = ShiftSerializer(shift).data
+        broadcast_after_commit(broadcast_shift_update, {
+            'action': 'ended',
+            'shift': dict(shift_data)
+        })
         
-        return Response(ShiftSerializer(shift).data)
+        return Response(shift_data)
     
     @action(detail=False, methods=['get'], url_path='employee-performance')
     def employee_performance(self, request):
         """Get employee performance metrics"""
-        from django.db.models import Sum, Count, Avg, Max
+        from django.db.models import Sum, Count, Avg, Max, OuterRef, Subquery
         
         # Filter by date range if provided
         start_date = request.query_params.get('start_date')
@@ -1420,16 +1709,27 @@ class ShiftViewSet(viewsets.ModelViewSet):
         if end_date:
             shifts = shifts.filter(start_time__date__lte=end_date)
         
-        # Aggregate performance by user using Sale model directly
+        # Total each shift's sales in a correlated subquery rather than joining
+        # shifts x sales, which would also force a DISTINCT shift count
+        shift_sales = Sale.objects.filter(shift=OuterRef('pk')).order_by().values('shift').annotate(
+            count=Count('id'),
+            revenue=Sum('total_amount')
+        )
+        shifts = shifts.annotate(
+            shift_sales=Subquery(shift_sales.values('count')),
+            shift_revenue=Subquery(shift_sales.values('revenue'))
+        )
+        
+        # Aggregate performance by user
         performance = shifts.values(
             'user__id',
             'user__username',
             'user__first_name',
             'user__last_name'
         ).annotate(
-            shift_count=Count('id', distinct=True),
-            total_sales=Count('sales__id'),
-            total_revenue=Sum('sales__total_amount'),
+            shift_count=Count('id'),
+            total_sales=Sum('shift_sales'),
+            total_revenue=Sum('shift_revenue'),
             last_shift=Max('start_time')
         ).order_by('-total_revenue')
         
@@ -1,100 +1,274 @@
 # backend/inventory/websocket_utils.py
-import json
+import asyncio
+import logging
+import queue
+import threading
+import orjson
 from decimal import Decimal
-from django.core.serializers.json import DjangoJSONEncoder
+from functools import lru_cache, wraps
+from django.core.cache import cache
+from django.db import transaction
 from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-
-
-def serialize_data(data):
-    """Convert data to JSON-serializable format, handling Decimal and DRF types"""
-    from collections import OrderedDict
-    from rest_framework.utils.serializer_helpers import ReturnDict, ReturnList
-    
-    if isinstance(data, (dict, OrderedDict, ReturnDict)):
-        return {key: serialize_data(value) for key, value in data.items()}
-    elif isinstance(data, (list, tuple, ReturnList)):
-        return [serialize_data(item) for item in data]
-    elif isinstance(data, Decimal):
-        return float(data)
-    elif hasattr(data, 'isoformat'):  # datetime objects
-        return data.isoformat()
-    elif hasattr(data, '__dict__') and not isinstance(data, type):
-        return serialize_data(data.__dict__)
-    return data
 
+try:
+    import uvloop
+except ImportError:  # optional; not available on Windows
+    uvloop = None
 
+logger = logging.getLogger(__name__)
+
+# Channel-layer groups every RealtimeConsumer joins
+DASHBOARD_GROUP = "dashboard_updates"
+INVENTORY_GROUP = "inventory_updates"
+SALES_GROUP = "sales_updates"
+SHIFTS_GROUP = "shifts_updates"
+
+_thread_loops = threading.local()
+_pending_sends = set()
+
+
+@lru_cache(maxsize=None)
+def default_channel_layer():
+    """The default channel layer, resolved once instead of re-reading CHANNEL_LAYERS per broadcast"""
+    return get_channel_layer()
+
+
+def broadcast_loop():
+    """
+    This thread's persistent event loop for channel-layer sends, on uvloop when installed.
+    Reusing one loop lets the layer keep its Redis connections between broadcasts, where
+    async_to_sync would start and tear down a fresh loop (and connection) per call.
+    """
+    loop = getattr(_thread_loops, 'loop', None)
+    if loop is None:
+        loop = _thread_loops.loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+    return loop
+
+
+def sync_group_send(group, message):
+    """
+    group_send for sync code such as the background sender. When called from code
+    already running on an event loop (consumer, async view), the send is scheduled
+    on that loop instead, since blocking it would deadlock.
+    """
+    send = default_channel_layer().group_send(group, message)
+    try:
+        running_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        broadcast_loop().run_until_complete(send)
+        return
+    task = running_loop.create_task(send)
+    # The loop only keeps weak references to tasks; hold this one until it finishes
+    _pending_sends.add(task)
+    task.add_done_callback(_pending_sends.discard)
+
+
+def _json_default(obj):
+    # Only called for types orjson can't encode natively
+    if isinstance(obj, Decimal):
+        # Clients compare these numerically (e.g. the shift balance check)
+        return float(obj)
+    if hasattr(obj, 'isoformat'):
+        return obj.isoformat()
+    if hasattr(obj, '__dict__') and not isinstance(obj, type):
+        return obj.__dict__
+    raise TypeError(f'Type is not JSON serializable: {type(obj).__name__}')
+
+
+def encode_data(data):
+    """
+    JSON-encode a broadcast payload in one orjson pass. DRF's ReturnDict/ReturnList,
+    datetimes and other natively supported types never reach Python code;
+    Decimal becomes a float.
+    """
+    return orjson.dumps(data, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+# Sales within this many seconds share one dashboard refresh signal
+DASHBOARD_BROADCAST_WINDOW = 2
+DASHBOARD_BROADCAST_LOCK = 'dashboard:broadcast_lock'
+
+
+# Pending broadcasts beyond this are dropped rather than queued without bound while Redis is slow
+BROADCAST_QUEUE_SIZE = 1000
+# Broadcasts already queued when the sender wakes go out together, up to this many per group_send
+BROADCAST_BATCH_SIZE = 64
+
+_broadcast_queue = queue.Queue(maxsize=BROADCAST_QUEUE_SIZE)
+_sender_lock = threading.Lock()
+_sender = None
+
+
+def _send_batch(batch):
+    # Coalesce batchable broadcasts into one group_send per group; others run as-is, in order
+    grouped = {}
+    for broadcast, data in batch:
+        target = BATCHED_BROADCASTS.get(broadcast)
+        if target is None:
+            try:
+                broadcast(data)
+            except Exception as e:
+                logger.warning("WebSocket broadcast error: %s", e)
+            continue
+        group, event_type = target
+        try:
+            grouped.setdefault(group, []).append(group_message(event_type, data))
+        except Exception as e:
+            logger.warning("WebSocket broadcast error: %s", e)
+
+    for group, events in grouped.items():
+        try:
+            if len(events) == 1:
+                sync_group_send(group, events[0])
+            else:
+                sync_group_send(group, {"type": "batch_update", "events": events})
+        except Exception as e:
+            logger.warning("WebSocket broadcast error: %s", e)
+
+
+def _send_forever():
+    # One sender keeps broadcasts in order and reuses a single thread for every channel-layer call
+    while True:
+        batch = [_broadcast_queue.get()]
+        while len(batch) < BROADCAST_BATCH_SIZE:
+            try:
+                batch.append(_broadcast_queue.get_nowait())
+            except queue.Empty:
+                break
+        _send_batch(batch)
+
+
+def _enqueue_broadcast(broadcast, data):
+    global _sender
+    try:
+        _broadcast_queue.put_nowait((broadcast, data))
+    except queue.Full:
+        logger.warning("Broadcast queue full, dropping %s", broadcast.__name__)
+        return
+    with _sender_lock:
+        if _sender is None or not _sender.is_alive():
+            _sender = threading.Thread(target=_send_forever, name='websocket-broadcaster', daemon=True)
+            _sender.start()
+
+
+def send_in_background(broadcast, data, delay=0):
+    """Queue a broadcast_* helper for the background sender (optionally after `delay` seconds)"""
+    if delay:
+        timer = threading.Timer(delay, _enqueue_broadcast, (broadcast, data))
+        timer.daemon = True
+        timer.start()
+    else:
+        _enqueue_broadcast(broadcast, data)
+
+
+def broadcast_after_commit(broadcast, data):
+    """
+    Queue a broadcast_* helper for the background sender once the current transaction
+    commits, keeping the channel-layer round trip off the request path and never
+    announcing rows other clients can't read yet.
+    """
+    transaction.on_commit(lambda: send_in_background(broadcast, data))
+
+
+def broadcast_dashboard_update_debounced(data):
+    """
+    Like broadcast_after_commit(broadcast_dashboard_update, data), but coalesces bursts:
+    the first commit in a DASHBOARD_BROADCAST_WINDOW takes an atomic cache.add() lock and
+    broadcasts when the window closes, so every client refetches stats once per burst
+    and that refetch already includes the later sales.
+    """
+    def schedule():
+        try:
+            if cache.add(DASHBOARD_BROADCAST_LOCK, 1, timeout=DASHBOARD_BROADCAST_WINDOW):
+                send_in_background(broadcast_dashboard_update, data, delay=DASHBOARD_BROADCAST_WINDOW)
+        except Exception as e:
+            logger.warning("WebSocket broadcast error: %s", e)
+
+    transaction.on_commit(schedule)
+
+
+def group_message(event_type, data):
+    """
+    Channel-layer event for a RealtimeConsumer handler named `event_type`, carrying
+    the websocket frame already encoded so each recipient just forwards it.
+    """
+    return {"type": event_type, "text": encode_data({"type": event_type, "data": data}).decode()}
+
+
+# Coroutine variants for callers already on an event loop (consumers, async views):
+# they await the layer directly instead of hopping through async_to_sync.
+
+async def abroadcast_dashboard_update(data):
+    """Broadcast dashboard stats update to all connected clients"""
+    await default_channel_layer().group_send(DASHBOARD_GROUP, group_message("dashboard_update", data))
+
+
+async def abroadcast_inventory_update(product_data):
+    """Broadcast inventory change to all connected clients"""
+    await default_channel_layer().group_send(INVENTORY_GROUP, group_message("inventory_update", product_data))
+
+
+async def abroadcast_sales_update(sale_data):
+    """Broadcast new sale to all connected clients"""
+    await default_channel_layer().group_send(SALES_GROUP, group_message("sales_update", sale_data))
+
+
+async def abroadcast_shift_update(shift_data):
+    """Broadcast shift change to all connected clients"""
+    await default_channel_layer().group_send(SHIFTS_GROUP, group_message("shift_update", shift_data))
+
+
+async def abroadcast_low_stock_alert(product_data):
+    """Broadcast low stock alert to all connected clients"""
+    await default_channel_layer().group_send(INVENTORY_GROUP, group_message("low_stock_alert", product_data))
+
+
+def logs_broadcast_errors(broadcast):
+    """Log and swallow failures from a sync broadcast_* helper; a lost update must never break its caller"""
+    @wraps(broadcast)
+    def wrapper(data):
+        try:
+            broadcast(data)
+        except Exception:
+            logger.exception("WebSocket broadcast %s failed", broadcast.__name__)
+    return wrapper
+
+
+@logs_broadcast_errors
 def broadcast_dashboard_update(data):
     """Broadcast dashboard stats update to all connected clients"""
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        "dashboard_updates",
-        {
-            "type": "dashboard_update",
-            "data": serialize_data(data)
-        }
-    )
+    sync_group_send(DASHBOARD_GROUP, group_message("dashboard_update", data))
 
 
+@logs_broadcast_errors
 def broadcast_inventory_update(product_data):
     """Broadcast inventory change to all connected clients"""
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        "inventory_updates",
-        {
-            "type": "inventory_update",
-            "data": serialize_data(product_data)
-        }
-    )
+    sync_group_send(INVENTORY_GROUP, group_message("inventory_update", product_data))
 
 
+@logs_broadcast_errors
 def broadcast_sales_update(sale_data):
     """Broadcast new sale to all connected clients"""
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        "sales_updates",
-        {
-            "type": "sales_update",
-            "data": serialize_data(sale_data)
-        }
-    )
+    sync_group_send(SALES_GROUP, group_message("sales_update", sale_data))
 
 
+@logs_broadcast_errors
 def broadcast_shift_update(shift_data):
     """Broadcast shift change to all connected clients"""
-    import logging
-    logger = logging.getLogger(__name__)
-    
-    try:
-        channel_layer = get_channel_layer()
-        if not channel_layer:
-            logger.error("Channel layer is None - Redis may not be configured correctly")
-            return
-            
-        logger.info(f"Broadcasting shift update: {shift_data.get('action', 'unknown')}")
-        
-        # Serialize the data to handle Decimal objects
-        serialized_data = serialize_data(shift_data)
-        
-        async_to_sync(channel_layer.group_send)(
-            "shifts_updates",
-            {
-                "type": "shift_update",
-                "data": serialized_data
-            }
-        )
-        logger.info("Shift update broadcast successful")
-    except Exception as e:
-        logger.error(f"Error broadcasting shift update: {e}", exc_info=True)
+    logger.debug("Broadcasting shift update: %s", shift_data.get('action', 'unknown'))
+    sync_group_send(SHIFTS_GROUP, group_message("shift_update", shift_data))
 
 
+@logs_broadcast_errors
 def broadcast_low_stock_alert(product_data):
     """Broadcast low stock alert to all connected clients"""
-    channel_layer = get_channel_layer()
-    async_to_sync(channel_layer.group_send)(
-        "inventory_updates",
-        {
-            "type": "low_stock_alert",
-            "data": product_data
-        }
-    )
+    sync_group_send(INVENTORY_GROUP, group_message("low_stock_alert", product_data))
+
+
+# Queued helpers the sender may coalesce, with the (group, consumer handler) each targets
+BATCHED_BROADCASTS = {
+    broadcast_dashboard_update: (DASHBOARD_GROUP, "dashboard_update"),
+    broadcast_inventory_update: (INVENTORY_GROUP, "inventory_update"),
+    broadcast_sales_update: (SALES_GROUP, "sales_update"),
+    broadcast_low_stock_alert: (INVENTORY_GROUP, "low_stock_alert"),
+}
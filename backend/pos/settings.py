@@ -63,6 +63,7 @@ INSTALLED_APPS = [
     'channels',
     'rest_framework',
     'rest_framework_simplejwt',
+    'rest_framework_simplejwt.token_blacklist',  # logout and BLACKLIST_AFTER_ROTATION revoke refresh tokens
     'corsheaders',
     'inventory',
 ]
@@ -104,16 +105,32 @@ TEMPLATES = [
 WSGI_APPLICATION = 'pos.wsgi.application'
 ASGI_APPLICATION = 'pos.asgi.application'
 
-# Channels
+# Channels. USE_REDIS_PUBSUB_LAYER switches to the Pub/Sub layer: group_send becomes one
+# PUBLISH per group instead of a write per subscribed channel, over long-lived connections.
+# Messages sent while a client is reconnecting are not buffered with it.
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'BACKEND': (
+            'channels_redis.pubsub.RedisPubSubChannelLayer'
+            if os.getenv('USE_REDIS_PUBSUB_LAYER', 'False').lower() == 'true'
+            else 'channels_redis.core.RedisChannelLayer'
+        ),
         'CONFIG': {
             "hosts": [(os.getenv('REDIS_HOST', '127.0.0.1'), int(os.getenv('REDIS_PORT', 6379)))],
         },
     },
 }
 
+# Cache: Redis (shared with channels) when USE_REDIS_CACHE is set, otherwise per-process memory.
+# Dashboard stats and the low-stock list are only cached on a shared backend (cache_utils.cache_is_shared).
+if os.getenv('USE_REDIS_CACHE', 'False').lower() == 'true':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': f"redis://{os.getenv('REDIS_HOST', '127.0.0.1')}:{os.getenv('REDIS_PORT', 6379)}/1",
+        },
+    }
+
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -173,12 +190,16 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'inventory.authentication.ProfileJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_RENDERER_CLASSES': [
+        'inventory.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PAGINATION_CLASS': 'inventory.pagination.StandardResultsSetPagination',
     'PAGE_SIZE': 20
 }
 
@@ -460,9 +460,9 @@ const BulkImportDialog: React.FC<BulkImportDialogProps> = ({
                       ))}
                     </TableBody>
                   </Table>
-                  {preview.preview && preview.preview.length > 50 && (
+                  {(preview.total_rows ?? 0) > 50 && (
                     <div className="p-4 text-center text-sm text-gray-500">
-                      Showing first 50 of {preview.preview.length} products
+                      Showing first 50 of {preview.total_rows} products
                     </div>
                   )}
                 </div>
@@ -274,7 +274,7 @@ const POS: React.FC = () => {
     const loadRecentSales = async () => {
       try {
         const { data } = await api.get("/sales/", {
-          params: { limit: 10, ordering: "-created_at" },
+          params: { page_size: 10 }, // newest first by default
         });
         setRecentSales(Array.isArray(data.results) ? data.results : data);
       } catch (err) {